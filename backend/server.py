@@ -1,42 +1,313 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Depends, status
+from fastapi import BackgroundTasks, FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Depends, Query, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute, serialize_response
+from fastapi.utils import create_response_field
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
+from starlette.datastructures import Headers
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
+from typing import AsyncIterator, List, Optional, Tuple, Union
+from contextlib import asynccontextmanager
 import uuid
 from datetime import datetime, timezone, timedelta
+from email.utils import format_datetime, parsedate_to_datetime
 import base64
+import hashlib
+import json
+import asyncio
+import io
+import sys
+import argparse
+import time
+import math
+import bisect
+import threading
+import unicodedata
+from urllib.parse import quote
+import re
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pymongo import ASCENDING, DESCENDING, TEXT, ReturnDocument, monitoring
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
+from gridfs.errors import NoFile
+from cachetools import TTLCache
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 from emergentintegrations.llm.openai import OpenAITextToSpeech
+from litellm import acompletion
+from openai import AsyncOpenAI
+import httpx
 import jwt
 from passlib.context import CryptContext
+from PIL import Image, ImageOps
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ============ Metrics ============
+# In-process Prometheus-style metrics. Recording is a dict update under one lock (Mongo command
+# events arrive on driver threads), cheap enough to leave on; rendering happens only on scrape.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = tuple(float(1024 * 4 ** power) for power in range(9))  # 1 KB to 64 MB
+metrics_lock = threading.Lock()
+metric_families = []
+
+def format_metric_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+class Metric:
+    def __init__(self, name: str, help_text: str, kind: str, label_names: Tuple[str, ...] = (), buckets: Optional[Tuple[float, ...]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.label_names = label_names
+        self.buckets = buckets
+        self.values = {}
+        metric_families.append(self)
+    
+    def inc(self, *labels, amount: float = 1.0):
+        with metrics_lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+    
+    def observe(self, value: float, *labels):
+        with metrics_lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+    
+    def render(self) -> List[str]:
+        with metrics_lock:
+            values = [(labels, {"counts": list(value["counts"]), "sum": value["sum"]} if self.kind == "histogram" else value) for labels, value in self.values.items()]
+        
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in values:
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{format_metric_labels(self.label_names, labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), value["counts"]):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f"{self.name}_bucket{format_metric_labels(self.label_names + ('le',), labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_metric_labels(self.label_names, labels)} {value['sum']}")
+            lines.append(f"{self.name}_count{format_metric_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+http_request_duration = Metric("revivedu_http_request_duration_seconds", "Time to produce a response, by route template", "histogram", ("method", "route", "status"), LATENCY_BUCKETS)
+http_requests_in_flight = Metric("revivedu_http_requests_in_flight", "Requests currently being handled, by route template", "gauge", ("method", "route"))
+mongo_command_duration = Metric("revivedu_mongo_command_duration_seconds", "MongoDB command round trips", "histogram", ("collection", "command"), LATENCY_BUCKETS)
+mongo_command_failures = Metric("revivedu_mongo_command_failures_total", "MongoDB commands that returned an error", "counter", ("collection", "command"))
+llm_request_duration = Metric("revivedu_llm_request_duration_seconds", "Activity completions including hedges and fallback", "histogram", ("model", "outcome"), LATENCY_BUCKETS)
+llm_tokens = Metric("revivedu_llm_tokens_total", "LLM tokens by model; source is reported by the provider or estimated at four characters per token", "counter", ("model", "kind", "source"))
+tts_request_duration = Metric("revivedu_tts_request_duration_seconds", "Text-to-speech synthesis calls", "histogram", ("model", "outcome"), LATENCY_BUCKETS)
+tts_audio_bytes = Metric("revivedu_tts_audio_bytes", "Size of synthesized audio", "histogram", ("model",), SIZE_BUCKETS)
+password_hash_duration = Metric("revivedu_password_hash_duration_seconds", "bcrypt work in the hashing pool, excluding queueing", "histogram", ("operation",), LATENCY_BUCKETS)
+artifact_upload_bytes = Metric("revivedu_artifact_upload_bytes", "Size of stored artifact uploads", "histogram", (), SIZE_BUCKETS)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self.collections = {}
+    
+    def started(self, event):
+        # Most commands name their collection as the command's value; getMore carries it separately
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            target = event.command.get("collection")
+        self.collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else "-"
+    
+    def succeeded(self, event):
+        collection = self.collections.pop((event.connection_id, event.request_id), "-")
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+    
+    def failed(self, event):
+        collection = self.collections.pop((event.connection_id, event.request_id), "-")
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+        mongo_command_failures.inc(collection, event.command_name)
+
+class InstrumentedRoute(APIRoute):
+    # Labels by route template rather than raw path so ids never multiply the series
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        
+        async def instrumented_handler(request: Request) -> Response:
+            labels = (request.method, self.path_format)
+            http_requests_in_flight.inc(*labels)
+            started = time.perf_counter()
+            
+            def finish(status_code: int):
+                http_requests_in_flight.inc(*labels, amount=-1)
+                http_request_duration.observe(time.perf_counter() - started, *labels, str(status_code))
+            
+            try:
+                response = await handler(request)
+            except HTTPException as e:
+                finish(e.status_code)
+                raise
+            except RequestValidationError:
+                finish(422)
+                raise
+            except BaseException:
+                finish(500)
+                raise
+            
+            # Streamed bodies (SSE, audio, artifacts) are sent after the handler returns, so
+            # their request is only finished once the last chunk has gone out
+            if isinstance(response, StreamingResponse):
+                response.body_iterator = iterate_then_finish(response.body_iterator, finish, response.status_code)
+            else:
+                finish(response.status_code)
+            return response
+        
+        return instrumented_handler
+
+async def iterate_then_finish(body_iterator: AsyncIterator, finish, status_code: int) -> AsyncIterator:
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        finish(status_code)
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
+audio_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="tts_audio")
+artifact_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="artifact_blobs")
+
 # JWT and Password settings
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'revivedu-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Authenticated user resolution goes through a short-TTL cache. Embedding claims in the token
+# (opt-in) skips even that, but name/email changes then only reach tokens when they are reissued
+USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS', 60))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+JWT_EMBED_USER_CLAIMS = os.environ.get('JWT_EMBED_USER_CLAIMS', 'false').lower() == 'true'
+
+# Pinning min and max rounds to the configured cost makes hashes at any other cost
+# report needs_update, so they are rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 4))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 64))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
 security = HTTPBearer(auto_error=False)
 
-# Create the main app without a prefix
-app = FastAPI()
+# Generation cache settings
+GENERATION_CACHE_TTL_SECONDS = int(os.environ.get('GENERATION_CACHE_TTL_SECONDS', 60 * 60 * 24 * 7))
+GENERATION_CACHE_MEMORY_SIZE = int(os.environ.get('GENERATION_CACHE_MEMORY_SIZE', 512))
+
+# Generation job settings
+GENERATION_WORKER_CONCURRENCY = int(os.environ.get('GENERATION_WORKER_CONCURRENCY', 4))
+GENERATION_JOB_POLL_SECONDS = float(os.environ.get('GENERATION_JOB_POLL_SECONDS', 5))
+GENERATION_JOB_MAX_ATTEMPTS = int(os.environ.get('GENERATION_JOB_MAX_ATTEMPTS', 3))
+# A running job holds a lease renewed every LEASE/4 seconds; only jobs whose lease lapsed are
+# requeued, and failed attempts wait RETRY_BACKOFF * 2^(attempt - 1) seconds before the next one
+GENERATION_JOB_LEASE_SECONDS = float(os.environ.get('GENERATION_JOB_LEASE_SECONDS', 120))
+GENERATION_JOB_RETRY_BACKOFF_SECONDS = float(os.environ.get('GENERATION_JOB_RETRY_BACKOFF_SECONDS', 15))
+
+# Text-to-speech settings
+TTS_MODEL = os.environ.get('TTS_MODEL', 'tts-1')
+TTS_VOICE = os.environ.get('TTS_VOICE', 'nova')  # Clear, energetic voice suitable for educational content
+TTS_SPEED = float(os.environ.get('TTS_SPEED', 1.0))
+
+# Binary streaming settings
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 256 * 1024))
+
+# HTTP caching policies for conditional read endpoints; generated activities never change
+ACTIVITY_CACHE_CONTROL = os.environ.get('ACTIVITY_CACHE_CONTROL', 'public, max-age=86400, immutable')
+ACTIVITY_LIST_CACHE_CONTROL = os.environ.get('ACTIVITY_LIST_CACHE_CONTROL', 'public, max-age=30, stale-while-revalidate=300')
+FEEDBACK_CACHE_CONTROL = os.environ.get('FEEDBACK_CACHE_CONTROL', 'public, no-cache')
+EXPOSURE_REPORT_CACHE_CONTROL = os.environ.get('EXPOSURE_REPORT_CACHE_CONTROL', 'private, no-cache')
+
+# Artifact storage settings
+ARTIFACT_MAX_BYTES = int(os.environ.get('ARTIFACT_MAX_BYTES', 25 * 1024 * 1024))
+ARTIFACT_FORM_OVERHEAD_BYTES = 64 * 1024  # multipart boundaries and the small form fields
+# Only raster images are rendered inline; anything else could carry script for the API origin
+ARTIFACT_INLINE_CONTENT_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp", "image/avif", "image/bmp"}
+IMAGE_WORKER_PROCESSES = int(os.environ.get('IMAGE_WORKER_PROCESSES', 2))
+ARTIFACT_DERIVATIVES = {
+    "thumbnail": {"max_size": 320, "format": "WEBP", "content_type": "image/webp", "quality": 80},
+    "preview": {"max_size": 1280, "format": "JPEG", "content_type": "image/jpeg", "quality": 85}
+}
+
+# AI provider settings ("emergent", "openai" or the offline "stub")
+LLM_PROVIDER = os.environ.get('LLM_PROVIDER', 'emergent')
+LLM_MODEL_PROVIDER = os.environ.get('LLM_MODEL_PROVIDER', 'openai')
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gpt-4o')
+LLM_REPAIR_MODEL = os.environ.get('LLM_REPAIR_MODEL', 'gpt-4o-mini')
+LLM_API_BASE = os.environ.get('LLM_API_BASE')
+# The proxy LlmChat routes the Emergent universal key through; litellm streaming must use it too
+EMERGENT_LLM_API_BASE = os.environ.get('EMERGENT_LLM_API_BASE', 'https://integrations.emergentagent.com/llm')
+LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', 90))
+TTS_TIMEOUT_SECONDS = float(os.environ.get('TTS_TIMEOUT_SECONDS', 60))
+LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', 20))
+
+# Latency SLO settings for activity generation: the primary model gets LLM_ATTEMPT_TIMEOUT_SECONDS,
+# a hedged duplicate is sent after LLM_HEDGE_DELAY_SECONDS (0 disables), and a miss falls back
+# to LLM_FALLBACK_MODEL (empty disables)
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.environ.get('LLM_ATTEMPT_TIMEOUT_SECONDS', 30))
+LLM_HEDGE_DELAY_SECONDS = float(os.environ.get('LLM_HEDGE_DELAY_SECONDS', 12))
+LLM_FALLBACK_MODEL = os.environ.get('LLM_FALLBACK_MODEL', 'gpt-4o-mini')
+LLM_FALLBACK_TIMEOUT_SECONDS = float(os.environ.get('LLM_FALLBACK_TIMEOUT_SECONDS', 30))
+LLM_OUTCOME_RETENTION_DAYS = int(os.environ.get('LLM_OUTCOME_RETENTION_DAYS', 30))
+STUB_LATENCY_SECONDS = float(os.environ.get('STUB_LATENCY_SECONDS', 0))
+
+# Pre-generation pool settings: keep a small stock of unserved activities for the most
+# requested combinations, filled only while no user generation has run for a while
+PREGENERATION_ENABLED = os.environ.get('PREGENERATION_ENABLED', 'true').lower() == 'true'
+PREGENERATION_HOT_COMBINATIONS = int(os.environ.get('PREGENERATION_HOT_COMBINATIONS', 20))
+PREGENERATION_STOCK_PER_COMBINATION = int(os.environ.get('PREGENERATION_STOCK_PER_COMBINATION', 2))
+PREGENERATION_DEMAND_WINDOW_DAYS = int(os.environ.get('PREGENERATION_DEMAND_WINDOW_DAYS', 7))
+PREGENERATION_IDLE_SECONDS = float(os.environ.get('PREGENERATION_IDLE_SECONDS', 30))
+PREGENERATION_INTERVAL_SECONDS = float(os.environ.get('PREGENERATION_INTERVAL_SECONDS', 15))
+PREGENERATION_TOKEN_BUDGET_PER_HOUR = int(os.environ.get('PREGENERATION_TOKEN_BUDGET_PER_HOUR', 50000))
+PREGENERATION_STOCK_TTL_DAYS = int(os.environ.get('PREGENERATION_STOCK_TTL_DAYS', 14))
+
+# Similarity index settings for retrieve-before-generate
+SIMILARITY_THRESHOLD = float(os.environ.get('SIMILARITY_THRESHOLD', 0.75))
+SIMILARITY_TEXT_WEIGHT = float(os.environ.get('SIMILARITY_TEXT_WEIGHT', 0.3))
+SIMILARITY_AGE_TOLERANCE = int(os.environ.get('SIMILARITY_AGE_TOLERANCE', 3))
+SIMILARITY_REFRESH_SECONDS = float(os.environ.get('SIMILARITY_REFRESH_SECONDS', 60))
+# Refreshes reread this far behind the newest indexed created_at, for writes that land late
+SIMILARITY_REFRESH_OVERLAP_SECONDS = float(os.environ.get('SIMILARITY_REFRESH_OVERLAP_SECONDS', 300))
+
+# Recommendation scoring weights; each component is scaled to [0, 1] (ratings to [-1, 1])
+RECOMMENDATION_WEIGHTS = {
+    "exposure_gap": float(os.environ.get('RECOMMENDATION_GAP_WEIGHT', 0.35)),
+    "age_fit": float(os.environ.get('RECOMMENDATION_AGE_WEIGHT', 0.25)),
+    "interests": float(os.environ.get('RECOMMENDATION_INTEREST_WEIGHT', 0.25)),
+    "rating_affinity": float(os.environ.get('RECOMMENDATION_RATING_WEIGHT', 0.15))
+}
+
+# Batch generation settings
+BATCH_GENERATION_CONCURRENCY = int(os.environ.get('BATCH_GENERATION_CONCURRENCY', 4))
+BATCH_GENERATION_MAX_ITEMS = int(os.environ.get('BATCH_GENERATION_MAX_ITEMS', 20))
+
+# Create the main app without a prefix; responses are encoded with orjson
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=InstrumentedRoute)
 
 # Configure logging
 logging.basicConfig(
@@ -133,6 +404,24 @@ class Activity(BaseModel):
     real_world_connection: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class ActivityContent(BaseModel):
+    # The part of an activity written by the LLM; also the source of its output schema
+    title: str
+    objective: str
+    description: str
+    expected_outcome: str
+    materials_required: List[str]
+    curricular_areas: dict
+    instructions: List[str]
+    success_metrics: List[str]
+    reflection_question: str
+    learning_outcomes: List[str] = []
+    skills: List[str] = []
+    estimated_time: Optional[str] = None
+    extensions: List[str] = []
+    discussion_questions: List[str] = []
+    real_world_connection: Optional[str] = None
+
 class ActivityResponse(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
@@ -158,6 +447,62 @@ class ActivityResponse(BaseModel):
     real_world_connection: Optional[str] = None
     created_at: str
 
+class ActivitySummaryResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    child_id: Optional[str] = None
+    age: int
+    subjects: List[str]
+    intelligences: List[str]
+    tools: List[str]
+    title: str
+    description: str
+    estimated_time: Optional[str] = None
+    created_at: str
+
+class ActivitySearchResult(ActivitySummaryResponse):
+    score: float
+
+class ActivityMatch(BaseModel):
+    score: float
+    activity: ActivitySummaryResponse
+
+class ActivityRetrieveResponse(BaseModel):
+    matches: List[ActivityMatch]
+    generated: Optional[ActivityResponse] = None
+    index_size: int
+
+class ActivityBatchInput(BaseModel):
+    inputs: List[ActivityInput] = Field(default_factory=list, max_length=BATCH_GENERATION_MAX_ITEMS)
+    input: Optional[ActivityInput] = None
+    variations: int = Field(1, ge=1, le=BATCH_GENERATION_MAX_ITEMS)
+    fresh: bool = False
+
+class ActivityBatchItem(BaseModel):
+    index: int
+    activity: Optional[ActivityResponse] = None
+    error: Optional[str] = None
+
+class ActivityBatchResponse(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    items: List[ActivityBatchItem]
+
+class GenerationJobResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    status: str
+    progress: int
+    stage: str
+    attempts: int = 0
+    activity_id: Optional[str] = None
+    activity: Optional[ActivityResponse] = None
+    error: Optional[str] = None
+    available_at: Optional[str] = None
+    created_at: str
+    updated_at: str
+
 class FeedbackInput(BaseModel):
     activity_id: str
     child_id: Optional[str] = None
@@ -184,7 +529,11 @@ class Artifact(BaseModel):
     child_id: Optional[str] = None
     filename: str
     content_type: str
-    file_data: str
+    size: int
+    sha256: str
+    blob_id: str
+    derivatives: dict = {}
+    derivatives_status: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ArtifactResponse(BaseModel):
@@ -194,7 +543,11 @@ class ArtifactResponse(BaseModel):
     child_id: Optional[str] = None
     filename: str
     content_type: str
-    file_data: str
+    size: Optional[int] = None
+    content_url: str
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
+    derivatives_status: Optional[str] = None
     created_at: str
 
 class ExposureReport(BaseModel):
@@ -209,20 +562,82 @@ class ExposureReport(BaseModel):
     recommendations: List[str]
     generated_at: str
 
+class ExposureTrendBucket(BaseModel):
+    bucket_start: str
+    activities: int
+    intelligence_exposure: dict
+    subject_exposure: dict
+    ratings: int
+    average_rating: Optional[float] = None
+    rolling_average_rating: Optional[float] = None
+
+class ExposureTrends(BaseModel):
+    child_id: str
+    interval: str
+    start: Optional[str] = None
+    end: Optional[str] = None
+    buckets: List[ExposureTrendBucket]
+    generated_at: str
+
+class RecommendedActivity(BaseModel):
+    score: float
+    components: dict
+    activity: ActivityResponse
+
+class ChildRecommendations(BaseModel):
+    child_id: str
+    candidates: int
+    recommendations: List[RecommendedActivity]
+    generated_at: str
+
 # ============ Helper Functions ============
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+password_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="bcrypt")
+password_hash_semaphore = asyncio.Semaphore(PASSWORD_HASH_CONCURRENCY)
+password_hash_stats = {"queued": 0, "running": 0, "completed": 0, "rejected": 0, "rehashed": 0, "total_seconds": 0.0}
+
+async def run_password_hashing(func, *args):
+    if password_hash_stats["queued"] >= PASSWORD_HASH_MAX_QUEUE:
+        password_hash_stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Authentication is busy, please retry shortly")
+    
+    password_hash_stats["queued"] += 1
+    try:
+        await password_hash_semaphore.acquire()
+    finally:
+        password_hash_stats["queued"] -= 1
+    
+    password_hash_stats["running"] += 1
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_hash_executor, func, *args)
+    finally:
+        elapsed = time.perf_counter() - started
+        password_hash_stats["running"] -= 1
+        password_hash_stats["completed"] += 1
+        password_hash_stats["total_seconds"] += elapsed
+        password_hash_duration.observe(elapsed, func.__name__)
+        password_hash_semaphore.release()
+
+async def hash_password(password: str) -> str:
+    return await run_password_hashing(pwd_context.hash, password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    # Returns whether the password matched and, if the stored hash uses an outdated cost, a replacement hash
+    return await run_password_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
 
-def create_access_token(data: dict) -> str:
+def create_access_token(data: dict, user: Optional[dict] = None) -> str:
     to_encode = data.copy()
+    if user and JWT_EMBED_USER_CLAIMS:
+        to_encode.update({"name": user["name"], "email": user["email"]})
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+user_cache_stats = {"claims_hits": 0, "cache_hits": 0, "misses": 0}
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Optional[dict]:
     if not credentials:
         return None
@@ -232,22 +647,332 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         user_id: str = payload.get("sub")
         if user_id is None:
             return None
+        
+        if JWT_EMBED_USER_CLAIMS and payload.get("name") and payload.get("email"):
+            user_cache_stats["claims_hits"] += 1
+            return {"id": user_id, "name": payload["name"], "email": payload["email"]}
+        
+        user = user_cache.get(token)
+        if user is not None:
+            user_cache_stats["cache_hits"] += 1
+            return user
+        
+        user_cache_stats["misses"] += 1
         user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+        if user:
+            user_cache[token] = user
         return user
     except jwt.ExpiredSignatureError:
         return None
     except jwt.JWTError:
         return None
 
-async def generate_activity_with_ai(input_data: ActivityInput) -> dict:
-    try:
-        emergent_key = os.environ.get('EMERGENT_LLM_KEY')
-        
-        subjects_str = ", ".join(input_data.subjects)
-        intelligences_str = ", ".join(input_data.intelligences)
-        tools_str = ", ".join(input_data.tools)
+# ============ AI Providers ============
+def estimate_tokens(text: str) -> int:
+    # Rough token estimate: about four characters per token
+    return len(text) // 4
+
+def record_llm_usage(model: str, usage, system_message: str = "", prompt: str = "", completion: str = ""):
+    # Prefers the provider's own usage report; estimates only when there is none
+    if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+        llm_tokens.inc(model, "prompt", "reported", amount=usage.prompt_tokens)
+        llm_tokens.inc(model, "completion", "reported", amount=usage.completion_tokens or 0)
+    else:
+        llm_tokens.inc(model, "prompt", "estimated", amount=estimate_tokens(system_message) + estimate_tokens(prompt))
+        llm_tokens.inc(model, "completion", "estimated", amount=estimate_tokens(completion))
+
+class EmergentProvider:
+    # Emergent universal key: completions through LlmChat, streaming through litellm,
+    # and one shared TTS client for the life of the process
+    def __init__(self):
+        self.api_key = os.environ.get('EMERGENT_LLM_KEY')
+        self.tts = OpenAITextToSpeech(api_key=self.api_key)
+    
+    async def complete(self, system_message: str, prompt: str, model: Optional[str] = None, json_schema: Optional[dict] = None) -> str:
+        # LlmChat has no structured-output option, so the schema travels in the system message
+        if json_schema:
+            system_message = f"{system_message}\nThe JSON must conform to this JSON Schema: {json.dumps(json_schema, separators=(',', ':'))}"
         
-        prompt = f"""As an expert in educational program design with specialized knowledge of NCF-SE 2023 framework and National Institute of Open Schooling (NIOS) curriculum standards, create a comprehensive, contextualized learning activity for a {input_data.age}-year-old gifted/homeschooled child in India.
+        # LlmChat keeps conversation history per session, so each completion gets its own
+        chat = LlmChat(
+            api_key=self.api_key,
+            session_id=f"activity_{uuid.uuid4()}",
+            system_message=system_message
+        )
+        chat.with_model(LLM_MODEL_PROVIDER, model or LLM_MODEL)
+        response = await asyncio.wait_for(chat.send_message(UserMessage(text=prompt)), timeout=LLM_TIMEOUT_SECONDS)
+        # LlmChat returns only text, so its usage has to be estimated
+        record_llm_usage(model or LLM_MODEL, None, system_message, prompt, response)
+        return response
+    
+    async def stream(self, system_message: str, prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+        # Called directly, litellm would send the universal key to the stock provider endpoint
+        response = await acompletion(
+            model=f"{LLM_MODEL_PROVIDER}/{model or LLM_MODEL}",
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            api_key=self.api_key,
+            api_base=LLM_API_BASE or EMERGENT_LLM_API_BASE,
+            timeout=LLM_TIMEOUT_SECONDS,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in response:
+            if getattr(chunk, "usage", None):
+                record_llm_usage(model or LLM_MODEL, chunk.usage)
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+    
+    async def synthesize(self, text: str, model: str, voice: str, speed: float) -> bytes:
+        return await asyncio.wait_for(
+            self.tts.generate_speech(text=text, model=model, voice=voice, speed=speed),
+            timeout=TTS_TIMEOUT_SECONDS
+        )
+    
+    async def close(self):
+        pass
+
+class OpenAIProvider:
+    # Direct OpenAI-compatible endpoint over one pooled HTTP client
+    def __init__(self):
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0)
+        )
+        self.client = AsyncOpenAI(
+            api_key=os.environ.get('OPENAI_API_KEY') or os.environ.get('EMERGENT_LLM_KEY'),
+            base_url=LLM_API_BASE,
+            http_client=self.http_client
+        )
+    
+    async def complete(self, system_message: str, prompt: str, model: Optional[str] = None, json_schema: Optional[dict] = None) -> str:
+        response_format = (
+            {"type": "json_schema", "json_schema": {"name": "response", "schema": json_schema, "strict": False}}
+            if json_schema else {"type": "json_object"}
+        )
+        response = await self.client.chat.completions.create(
+            model=model or LLM_MODEL,
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            response_format=response_format
+        )
+        content = response.choices[0].message.content or ""
+        record_llm_usage(model or LLM_MODEL, response.usage, system_message, prompt, content)
+        return content
+    
+    async def stream(self, system_message: str, prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
+            model=model or LLM_MODEL,
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in response:
+            if chunk.usage:
+                record_llm_usage(model or LLM_MODEL, chunk.usage)
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+    
+    async def synthesize(self, text: str, model: str, voice: str, speed: float) -> bytes:
+        response = await self.client.audio.speech.create(
+            model=model, voice=voice, input=text, speed=speed, timeout=TTS_TIMEOUT_SECONDS
+        )
+        return response.content
+    
+    async def close(self):
+        await self.http_client.aclose()
+
+# One silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz); 38 frames is about a second
+SILENT_MP3_FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 413
+
+STUB_ACTIVITY = {
+    "title": "Shadow Shapes Exploration",
+    "objective": "Observe how light and objects create shadows and describe the patterns found.",
+    "description": "A hands-on activity exploring shadows with household objects and a torch.",
+    "expected_outcome": "The child explains how shadow size and shape change with light position.",
+    "materials_required": ["Torch", "Paper", "Pencil", "Small toys"],
+    "curricular_areas": {
+        "ncf_se_2023": ["Science: Light and Shadows"],
+        "nios_subjects": ["Science and Technology"],
+        "learning_domains": ["Cognitive", "Psychomotor"]
+    },
+    "instructions": [
+        "Darken the room and place a toy on the paper.",
+        "Shine the torch from different angles and trace each shadow.",
+        "Compare the tracings and describe what changed."
+    ],
+    "success_metrics": ["Traces at least three shadows", "Explains one pattern in their own words"],
+    "reflection_question": "Why does a shadow grow when the light moves closer?",
+    "learning_outcomes": ["Relates light position to shadow size"],
+    "skills": ["Observation", "Critical thinking"],
+    "estimated_time": "30-45 minutes",
+    "extensions": ["Track a sundial shadow across a day"],
+    "discussion_questions": ["Where do you see shadows outdoors?"],
+    "real_world_connection": "Sundials and shade structures use the same principles."
+}
+
+class StubProvider:
+    # Deterministic offline backend for benchmarks and load tests; no network access
+    async def complete(self, system_message: str, prompt: str, model: Optional[str] = None, json_schema: Optional[dict] = None) -> str:
+        if STUB_LATENCY_SECONDS:
+            await asyncio.sleep(STUB_LATENCY_SECONDS)
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]
+        activity = {**STUB_ACTIVITY, "title": f"{STUB_ACTIVITY['title']} {digest}"}
+        if json_schema and json_schema.get("properties"):
+            # Repair requests ask for a subset of fields
+            activity = {field: activity[field] for field in json_schema["properties"] if field in activity}
+        return json.dumps(activity)
+    
+    async def stream(self, system_message: str, prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+        text = await self.complete(system_message, prompt, model)
+        for offset in range(0, len(text), 16):
+            yield text[offset:offset + 16]
+    
+    async def synthesize(self, text: str, model: str, voice: str, speed: float) -> bytes:
+        if STUB_LATENCY_SECONDS:
+            await asyncio.sleep(STUB_LATENCY_SECONDS)
+        return SILENT_MP3_FRAME * 38
+    
+    async def close(self):
+        pass
+
+AI_PROVIDERS = {"emergent": EmergentProvider, "openai": OpenAIProvider, "stub": StubProvider}
+ai_provider = None
+
+def get_ai_provider():
+    global ai_provider
+    if ai_provider is None:
+        if LLM_PROVIDER not in AI_PROVIDERS:
+            raise ValueError(f"Unknown LLM_PROVIDER '{LLM_PROVIDER}'; expected one of {', '.join(AI_PROVIDERS)}")
+        ai_provider = AI_PROVIDERS[LLM_PROVIDER]()
+    return ai_provider
+
+# ============ LLM Latency SLOs ============
+llm_slo_stats = {
+    "calls": 0,
+    "primary_wins": 0,
+    "hedge_wins": 0,
+    "hedges_sent": 0,
+    "attempt_errors": 0,
+    "deadline_misses": 0,
+    "fallbacks": 0,
+    "fallback_failures": 0,
+    "total_seconds": 0.0
+}
+background_writes = set()
+
+def spawn_background(coroutine):
+    # Keeps a reference so fire-and-forget writes are not garbage collected mid-flight
+    task = asyncio.ensure_future(coroutine)
+    background_writes.add(task)
+    task.add_done_callback(background_writes.discard)
+    return task
+
+def record_llm_outcome(outcome: str, model: Optional[str], elapsed: float, hedged: bool, error: Optional[str] = None):
+    llm_slo_stats["total_seconds"] += elapsed
+    llm_request_duration.observe(elapsed, model or "-", outcome)
+    record = {
+        "outcome": outcome,
+        "model": model,
+        "latency_seconds": round(elapsed, 3),
+        "hedged": hedged,
+        "error": error,
+        "attempt_timeout_seconds": LLM_ATTEMPT_TIMEOUT_SECONDS,
+        "hedge_delay_seconds": LLM_HEDGE_DELAY_SECONDS,
+        "recorded_at": datetime.now(timezone.utc)
+    }
+    # Written in the background so recording never adds to request latency
+    spawn_background(db.llm_call_outcomes.insert_one(record))
+
+async def complete_with_slo(system_message: str, prompt: str, json_schema: Optional[dict] = None) -> str:
+    provider = get_ai_provider()
+    started = time.perf_counter()
+    deadline = started + LLM_ATTEMPT_TIMEOUT_SECONDS
+    llm_slo_stats["calls"] += 1
+    
+    def attempt() -> asyncio.Task:
+        return asyncio.ensure_future(provider.complete(system_message, prompt, model=LLM_MODEL, json_schema=json_schema))
+    
+    primary = attempt()
+    attempts = {primary: "primary"}
+    pending = {primary}
+    hedged = False
+    last_error = None
+    
+    try:
+        while pending:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            
+            # Wake up at the hedge point if it has not passed yet, otherwise at the deadline
+            hedge_at = started + LLM_HEDGE_DELAY_SECONDS
+            can_hedge = not hedged and 0 < LLM_HEDGE_DELAY_SECONDS < LLM_ATTEMPT_TIMEOUT_SECONDS
+            wake_at = min(hedge_at, deadline) if can_hedge else deadline
+            
+            done, pending = await asyncio.wait(pending, timeout=max(wake_at - now, 0), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    label = attempts[task]
+                    llm_slo_stats[f"{label}_wins"] += 1
+                    record_llm_outcome(label, LLM_MODEL, time.perf_counter() - started, hedged)
+                    return task.result()
+                llm_slo_stats["attempt_errors"] += 1
+                last_error = str(task.exception())
+                logger.error(f"LLM {attempts[task]} attempt failed: {last_error}")
+            
+            if can_hedge and time.perf_counter() >= hedge_at:
+                hedge = attempt()
+                attempts[hedge] = "hedge"
+                pending.add(hedge)
+                hedged = True
+                llm_slo_stats["hedges_sent"] += 1
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.cancel()
+    
+    if not pending and last_error is not None and time.perf_counter() < deadline:
+        outcome = "error"
+    else:
+        outcome = "deadline_miss"
+        llm_slo_stats["deadline_misses"] += 1
+    
+    if not LLM_FALLBACK_MODEL:
+        record_llm_outcome(outcome, LLM_MODEL, time.perf_counter() - started, hedged, last_error)
+        raise TimeoutError(f"LLM call failed ({outcome}): {last_error or 'deadline exceeded'}")
+    
+    llm_slo_stats["fallbacks"] += 1
+    try:
+        response = await asyncio.wait_for(
+            provider.complete(system_message, prompt, model=LLM_FALLBACK_MODEL, json_schema=json_schema),
+            timeout=LLM_FALLBACK_TIMEOUT_SECONDS
+        )
+    except Exception as e:
+        llm_slo_stats["fallback_failures"] += 1
+        record_llm_outcome("fallback_failure", LLM_FALLBACK_MODEL, time.perf_counter() - started, hedged, str(e) or "timeout")
+        raise
+    
+    record_llm_outcome(f"fallback_after_{outcome}", LLM_FALLBACK_MODEL, time.perf_counter() - started, hedged, last_error)
+    return response
+
+ACTIVITY_SYSTEM_MESSAGE = "You are an expert in educational program design with specialized knowledge of NCF-SE 2023 framework, National Institute of Open Schooling (NIOS) curriculum standards, NEP 2020, and Howard Gardner's Multiple Intelligences theory. You design pedagogically sound, differentiated learning activities for gifted and homeschooled children in India, ensuring alignment with national curricula while promoting holistic development. Always respond with valid JSON only."
+
+def build_activity_prompt(input_data: ActivityInput) -> str:
+    subjects_str = ", ".join(input_data.subjects)
+    intelligences_str = ", ".join(input_data.intelligences)
+    tools_str = ", ".join(input_data.tools)
+    
+    return f"""As an expert in educational program design with specialized knowledge of NCF-SE 2023 framework and National Institute of Open Schooling (NIOS) curriculum standards, create a comprehensive, contextualized learning activity for a {input_data.age}-year-old gifted/homeschooled child in India.
 
 **Context:**
 - Age: {input_data.age} years
@@ -265,56 +990,1613 @@ Design an activity that:
 6. Uses only the available materials at home
 7. Supports both gifted learners and homeschooling needs
 
-**Required Format (respond ONLY with valid JSON):**
-{{
-  "title": "Concise, engaging activity name",
-  "objective": "Clear, measurable learning goals aligned with developmental needs and curricular standards",
-  "description": "Brief overview (2-3 sentences) summarizing purpose and context",
-  "expected_outcome": "Specific skills, knowledge, or attitudes the child will develop",
-  "materials_required": ["Material 1", "Material 2", ...],
-  "curricular_areas": {{
-    "ncf_se_2023": ["Relevant domain/area from NCF-SE 2023"],
-    "nios_subjects": ["Relevant NIOS subject alignment for grades 10/12"],
-    "learning_domains": ["Cognitive", "Affective", "Psychomotor", "Social-Emotional"]
-  }},
-  "instructions": ["Detailed Step 1", "Detailed Step 2", ...],
-  "success_metrics": ["Quantifiable indicator 1", "Observable behavior 2", ...],
-  "reflection_question": "Thought-provoking prompt for critical thinking and self-assessment",
-  "learning_outcomes": ["Specific learning outcome 1", "Specific learning outcome 2", ...],
-  "skills": ["21st century skill 1", "SEL competency 2", ...],
-  "estimated_time": "Duration range (e.g., 45-60 minutes)",
-  "extensions": ["Advanced challenge 1", "Alternative approach 2", ...],
-  "discussion_questions": ["Question for deeper reflection 1", "Question 2", ...],
-  "real_world_connection": "How this activity connects to real-world applications and Indian context"
-}}
+**Required Format (respond ONLY with valid JSON):**
+{{
+  "title": "Concise, engaging activity name",
+  "objective": "Clear, measurable learning goals aligned with developmental needs and curricular standards",
+  "description": "Brief overview (2-3 sentences) summarizing purpose and context",
+  "expected_outcome": "Specific skills, knowledge, or attitudes the child will develop",
+  "materials_required": ["Material 1", "Material 2", ...],
+  "curricular_areas": {{
+    "ncf_se_2023": ["Relevant domain/area from NCF-SE 2023"],
+    "nios_subjects": ["Relevant NIOS subject alignment for grades 10/12"],
+    "learning_domains": ["Cognitive", "Affective", "Psychomotor", "Social-Emotional"]
+  }},
+  "instructions": ["Detailed Step 1", "Detailed Step 2", ...],
+  "success_metrics": ["Quantifiable indicator 1", "Observable behavior 2", ...],
+  "reflection_question": "Thought-provoking prompt for critical thinking and self-assessment",
+  "learning_outcomes": ["Specific learning outcome 1", "Specific learning outcome 2", ...],
+  "skills": ["21st century skill 1", "SEL competency 2", ...],
+  "estimated_time": "Duration range (e.g., 45-60 minutes)",
+  "extensions": ["Advanced challenge 1", "Alternative approach 2", ...],
+  "discussion_questions": ["Question for deeper reflection 1", "Question 2", ...],
+  "real_world_connection": "How this activity connects to real-world applications and Indian context"
+}}
+
+Make it pedagogically sound, differentiated, and holistic."""
+
+def parse_activity_json(response: str) -> dict:
+    response_text = response.strip()
+    if response_text.startswith("```json"):
+        response_text = response_text[7:]
+    if response_text.startswith("```"):
+        response_text = response_text[3:]
+    if response_text.endswith("```"):
+        response_text = response_text[:-3]
+    
+    return json.loads(response_text.strip())
+
+ACTIVITY_CONTENT_SCHEMA = ActivityContent.model_json_schema()
+generation_quality_stats = {
+    "responses": 0,
+    "parse_failures": 0,
+    "validation_failures": 0,
+    "repairs": 0,
+    "repaired_fields": 0,
+    "dropped_fields": 0,
+    "repair_failures": 0
+}
+
+def extract_json_object(response: str) -> dict:
+    try:
+        data = parse_activity_json(response)
+    except ValueError:
+        # Tolerate prose around the object by falling back to the outermost braces
+        start, end = response.find("{"), response.rfind("}")
+        if start == -1 or end <= start:
+            raise
+        data = json.loads(response[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    return data
+
+async def repair_activity_fields(data: dict, fields: List[str]) -> dict:
+    # Regenerates only the broken fields with a cheaper model, given the valid ones as context
+    context = {key: value for key, value in data.items() if key not in fields}
+    schema = {
+        "type": "object",
+        "properties": {field: ACTIVITY_CONTENT_SCHEMA["properties"][field] for field in fields},
+        "required": fields
+    }
+    prompt = (
+        f"This learning activity is missing valid values for: {', '.join(fields)}.\n"
+        f"Activity so far: {json.dumps(context)}\n"
+        f"Respond ONLY with a JSON object containing exactly these fields, consistent with the activity."
+    )
+    response = await get_ai_provider().complete(ACTIVITY_SYSTEM_MESSAGE, prompt, model=LLM_REPAIR_MODEL, json_schema=schema)
+    repaired = extract_json_object(response)
+    return {field: repaired[field] for field in fields if field in repaired}
+
+async def validate_activity_content(response: str) -> dict:
+    generation_quality_stats["responses"] += 1
+    try:
+        data = extract_json_object(response)
+    except ValueError:
+        generation_quality_stats["parse_failures"] += 1
+        raise
+    
+    try:
+        return ActivityContent(**data).model_dump()
+    except ValidationError as e:
+        invalid = sorted({str(error["loc"][0]) for error in e.errors() if error["loc"]})
+    
+    generation_quality_stats["validation_failures"] += 1
+    required = [field for field in invalid if field in ActivityContent.model_fields and ActivityContent.model_fields[field].is_required()]
+    
+    # Broken optional fields fall back to their defaults rather than costing another call
+    for field in invalid:
+        if field not in required:
+            data.pop(field, None)
+            generation_quality_stats["dropped_fields"] += 1
+    
+    if required:
+        generation_quality_stats["repairs"] += 1
+        generation_quality_stats["repaired_fields"] += len(required)
+        data.update(await repair_activity_fields(data, required))
+    
+    try:
+        return ActivityContent(**data).model_dump()
+    except ValidationError:
+        generation_quality_stats["repair_failures"] += 1
+        raise
+
+async def generate_activity_with_ai(input_data: ActivityInput) -> dict:
+    try:
+        response = await complete_with_slo(
+            ACTIVITY_SYSTEM_MESSAGE,
+            build_activity_prompt(input_data),
+            json_schema=ACTIVITY_CONTENT_SCHEMA
+        )
+        
+        activity_data = await validate_activity_content(response)
+        return activity_data
+        
+    except Exception as e:
+        logger.error(f"Error generating activity: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate activity: {str(e)}")
+
+# ============ Database Indexes ============
+# (collection, keys, options) for every index the query paths below rely on
+INDEX_SPECS = [
+    ("users", [("id", ASCENDING)], {"unique": True}),
+    ("users", [("email", ASCENDING)], {"unique": True}),
+    ("children", [("id", ASCENDING)], {"unique": True}),
+    ("children", [("user_id", ASCENDING), ("created_at", ASCENDING)], {}),
+    ("activities", [("id", ASCENDING)], {"unique": True}),
+    ("activities", [("created_at", DESCENDING), ("id", DESCENDING)], {}),
+    ("activities", [("subjects", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+    ("activities", [("intelligences", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+    ("activities", [("age", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+    ("activities", [("child_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+    ("activities", [("title", TEXT), ("description", TEXT), ("objective", TEXT), ("skills", TEXT), ("materials_required", TEXT)], {
+        "name": "activity_text_search",
+        "weights": {"title": 10, "description": 5, "objective": 3, "skills": 2, "materials_required": 1}
+    }),
+    ("feedbacks", [("id", ASCENDING)], {"unique": True}),
+    ("feedbacks", [("activity_id", ASCENDING), ("created_at", DESCENDING)], {}),
+    ("feedbacks", [("child_id", ASCENDING), ("created_at", DESCENDING)], {}),
+    ("artifacts", [("id", ASCENDING)], {"unique": True}),
+    ("artifacts", [("activity_id", ASCENDING), ("created_at", ASCENDING)], {}),
+    ("artifacts", [("sha256", ASCENDING)], {}),
+    ("artifact_blobs.files", [("sha256", ASCENDING), ("uploadDate", ASCENDING), ("_id", ASCENDING)], {}),
+    ("child_exposure", [("child_id", ASCENDING)], {"unique": True}),
+    ("generation_cache", [("key", ASCENDING)], {"unique": True}),
+    ("generation_cache", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ("llm_call_outcomes", [("recorded_at", ASCENDING)], {"expireAfterSeconds": LLM_OUTCOME_RETENTION_DAYS * 24 * 60 * 60}),
+    ("generation_demand", [("key", ASCENDING)], {"unique": True}),
+    ("generation_demand", [("last_requested_at", DESCENDING), ("count", DESCENDING)], {}),
+    ("generation_stock", [("key", ASCENDING), ("created_at", ASCENDING)], {}),
+    ("generation_stock", [("created_at", ASCENDING)], {"expireAfterSeconds": PREGENERATION_STOCK_TTL_DAYS * 24 * 60 * 60}),
+    ("generation_jobs", [("id", ASCENDING)], {"unique": True}),
+    ("generation_jobs", [("status", ASCENDING), ("created_at", ASCENDING)], {}),
+    ("generation_jobs", [("status", ASCENDING), ("updated_at", ASCENDING)], {}),
+]
+
+# (collection, filter, sort) shapes issued by the routes, checked by explain-queries
+QUERY_SHAPES = [
+    ("users", {"email": "user@example.com"}, None),
+    ("users", {"id": "user-id"}, None),
+    ("children", {"user_id": "user-id"}, None),
+    ("children", {"id": "child-id", "user_id": "user-id"}, None),
+    ("activities", {"id": "activity-id"}, None),
+    ("activities", {}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("activities", {"subjects": "Mathematics"}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("activities", {"intelligences": "Spatial"}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("activities", {"age": 8}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("activities", {"child_id": "child-id"}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("activities", {"$text": {"$search": "water cycle"}, "subjects": "Science"}, None),
+    ("feedbacks", {"activity_id": "activity-id"}, None),
+    ("feedbacks", {"child_id": "child-id"}, None),
+    ("artifacts", {"activity_id": "activity-id"}, [("created_at", ASCENDING)]),
+    ("child_exposure", {"child_id": "child-id"}, None),
+    ("generation_jobs", {"status": "queued"}, [("created_at", ASCENDING)]),
+    ("generation_jobs", {"status": "running", "updated_at": {"$lt": "2000-01-01T00:00:00+00:00"}}, None),
+]
+
+async def ensure_indexes():
+    # create_index is a no-op for indexes that already exist, so this is safe on every start
+    for collection, keys, options in INDEX_SPECS:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            logger.error(f"Error creating index {keys} on {collection}: {str(e)}")
+
+def find_plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages.extend(find_plan_stages(plan["inputStage"]))
+    for child in plan.get("inputStages", []):
+        stages.extend(find_plan_stages(child))
+    return [stage for stage in stages if stage]
+
+async def explain_query_shapes(slow_ms: int) -> List[dict]:
+    report = []
+    for collection, query, sort in QUERY_SHAPES:
+        command = {"find": collection, "filter": query, "limit": 100}
+        if sort:
+            command["sort"] = dict(sort)
+        explain = await db.command("explain", command, verbosity="executionStats")
+        
+        stats = explain.get("executionStats", {})
+        stages = find_plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        problems = []
+        if "COLLSCAN" in stages:
+            problems.append("COLLSCAN")
+        if "SORT" in stages:
+            problems.append("IN_MEMORY_SORT")
+        if stats.get("executionTimeMillis", 0) >= slow_ms:
+            problems.append("SLOW")
+        
+        report.append({
+            "collection": collection,
+            "filter": query,
+            "sort": sort,
+            "stages": stages,
+            "docs_examined": stats.get("totalDocsExamined", 0),
+            "keys_examined": stats.get("totalKeysExamined", 0),
+            "returned": stats.get("nReturned", 0),
+            "time_ms": stats.get("executionTimeMillis", 0),
+            "problems": problems
+        })
+    return report
+
+# ============ Serialization ============
+class DocumentSerializer:
+    # Stored documents were validated by their model on write, so read endpoints skip building
+    # response models (which FastAPI would validate and dump a second time): documents are
+    # projected to the response fields by Mongo, optional fields are defaulted and the body is
+    # encoded once with orjson. A document missing a required field still gets full validation.
+    def __init__(self, model):
+        self.model = model
+        self.projection = {"_id": 0, **{field: 1 for field in model.model_fields}}
+        self.required = frozenset(name for name, field in model.model_fields.items() if field.is_required())
+        self.defaults = {
+            name: field.get_default(call_default_factory=True)
+            for name, field in model.model_fields.items()
+            if not field.is_required()
+        }
+    
+    def document(self, doc: dict) -> dict:
+        if self.required.issubset(doc):
+            return {**self.defaults, **doc}
+        return self.model(**doc).model_dump()
+    
+    def response(self, content, headers: Optional[dict] = None) -> ORJSONResponse:
+        if isinstance(content, list):
+            return ORJSONResponse([self.document(doc) for doc in content], headers=headers)
+        return ORJSONResponse(self.document(content), headers=headers)
+
+activity_serializer = DocumentSerializer(ActivityResponse)
+activity_summary_serializer = DocumentSerializer(ActivitySummaryResponse)
+activity_search_serializer = DocumentSerializer(ActivitySearchResult)
+child_serializer = DocumentSerializer(ChildProfileResponse)
+
+# ============ Conditional Requests ============
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+def parse_stored_datetime(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def latest_timestamp(documents: List[dict], field: str = "created_at") -> Optional[datetime]:
+    timestamps = [parsed for parsed in (parse_stored_datetime(document.get(field)) for document in documents) if parsed]
+    return max(timestamps, default=None)
+
+def cache_headers(etag: str, last_modified: Optional[datetime], cache_control: str, extra: Optional[dict] = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control, **(extra or {})}
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    # If-None-Match takes precedence over If-Modified-Since; GET uses weak comparison
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+# ============ Pagination ============
+ACTIVITY_SUMMARY_PROJECTION = activity_summary_serializer.projection
+
+def encode_cursor(document: dict) -> str:
+    payload = json.dumps({"created_at": document["created_at"], "id": document["id"]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return {"created_at": str(payload["created_at"]), "id": str(payload["id"])}
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(cursor: dict) -> dict:
+    # Matches everything strictly after the cursor in (created_at desc, id desc) order
+    return {"$or": [
+        {"created_at": {"$lt": cursor["created_at"]}},
+        {"created_at": cursor["created_at"], "id": {"$lt": cursor["id"]}}
+    ]}
+
+# ============ Exposure Aggregates ============
+EXPOSURE_BACKFILL_ATTEMPTS = 3
+
+# Mongo field names cannot contain "." or start with "$", so counter keys are escaped
+def encode_exposure_key(name: str) -> str:
+    encoded = name.replace(".", "\uff0e")
+    return "\uff04" + encoded[1:] if encoded.startswith("$") else encoded
+
+def decode_exposure_key(key: str) -> str:
+    return key.replace("\uff0e", ".").replace("\uff04", "$")
+
+def decode_exposure_counts(counts: Optional[dict]) -> dict:
+    return {decode_exposure_key(key): value for key, value in (counts or {}).items()}
+
+def activity_exposure_update(activities: List[dict]) -> dict:
+    increments = {"total_activities": len(activities)}
+    skills = set()
+    for activity in activities:
+        for intel in activity.get("intelligences", []):
+            field = f"intelligence_counts.{encode_exposure_key(intel)}"
+            increments[field] = increments.get(field, 0) + 1
+        for subject in activity.get("subjects", []):
+            field = f"subject_counts.{encode_exposure_key(subject)}"
+            increments[field] = increments.get(field, 0) + 1
+        skills.update(activity.get("skills", []))
+    
+    # tracking_since is the earliest created_at counted incrementally, so the backfill never
+    # recounts these activities, even when they were generated long before they were inserted
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "$inc": increments,
+        "$addToSet": {"skills": {"$each": sorted(skills)}},
+        "$set": {"updated_at": now},
+        "$min": {"tracking_since": min(activity.get("created_at") or now for activity in activities)}
+    }
+
+async def record_activity_exposure(activities: List[dict]):
+    by_child = {}
+    for activity in activities:
+        if activity.get("child_id"):
+            by_child.setdefault(activity["child_id"], []).append(activity)
+    
+    for child_id, child_activities in by_child.items():
+        try:
+            await db.child_exposure.update_one({"child_id": child_id}, activity_exposure_update(child_activities), upsert=True)
+        except Exception as e:
+            logger.error(f"Error updating exposure for child {child_id}: {str(e)}")
+
+async def record_feedback_exposure(feedback: dict):
+    if not feedback.get("child_id"):
+        return
+    try:
+        now = datetime.now(timezone.utc).isoformat()
+        await db.child_exposure.update_one(
+            {"child_id": feedback["child_id"]},
+            {
+                "$inc": {"rating_total": feedback.get("rating", 0), "rating_count": 1},
+                "$set": {"updated_at": now},
+                "$min": {"tracking_since": feedback.get("created_at") or now}
+            },
+            upsert=True
+        )
+    except Exception as e:
+        logger.error(f"Error updating exposure for child {feedback['child_id']}: {str(e)}")
+
+def empty_child_exposure() -> dict:
+    return {
+        "total_activities": 0,
+        "intelligence_counts": {},
+        "subject_counts": {},
+        "skills": [],
+        "rating_total": 0,
+        "rating_count": 0
+    }
+
+async def scan_child_exposure(child_id: str, before: Optional[str] = None) -> dict:
+    exposure = empty_child_exposure()
+    skills = set()
+    query = {"child_id": child_id}
+    if before:
+        query["created_at"] = {"$lt": before}
+    
+    async for activity in db.activities.find(query, {"_id": 0, "intelligences": 1, "subjects": 1, "skills": 1}):
+        exposure["total_activities"] += 1
+        for intel in activity.get("intelligences", []):
+            key = encode_exposure_key(intel)
+            exposure["intelligence_counts"][key] = exposure["intelligence_counts"].get(key, 0) + 1
+        for subject in activity.get("subjects", []):
+            key = encode_exposure_key(subject)
+            exposure["subject_counts"][key] = exposure["subject_counts"].get(key, 0) + 1
+        skills.update(activity.get("skills", []))
+    
+    async for feedback in db.feedbacks.find(query, {"_id": 0, "rating": 1}):
+        exposure["rating_total"] += feedback.get("rating", 0)
+        exposure["rating_count"] += 1
+    
+    exposure["skills"] = sorted(skills)
+    return exposure
+
+async def rebuild_child_exposure(child_id: str) -> dict:
+    # Full recount for the maintenance command; increments landing mid-scan are overwritten,
+    # so live reads use backfill_child_exposure instead
+    now = datetime.now(timezone.utc).isoformat()
+    exposure = {
+        "child_id": child_id,
+        **await scan_child_exposure(child_id, before=now),
+        "initialized": True,
+        "tracking_since": now,
+        "updated_at": now
+    }
+    await db.child_exposure.replace_one({"child_id": child_id}, exposure, upsert=True)
+    return exposure
+
+async def backfill_child_exposure(child_id: str) -> dict:
+    # Incremental updates count everything created from tracking_since on, so the backfill adds
+    # only the history before it, with $inc, and never overwrites concurrent increments. The
+    # guard makes the update apply once even when several first reads race, and rescans when
+    # an increment moved tracking_since back while the history was being counted.
+    for _ in range(EXPOSURE_BACKFILL_ATTEMPTS):
+        now = datetime.now(timezone.utc).isoformat()
+        exposure = await db.child_exposure.find_one_and_update(
+            {"child_id": child_id},
+            {"$setOnInsert": {"tracking_since": now}},
+            upsert=True,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if exposure.get("initialized"):
+            return exposure
+        
+        since = exposure.get("tracking_since")
+        history = await scan_child_exposure(child_id, before=since)
+        result = await db.child_exposure.update_one(
+            {"child_id": child_id, "initialized": {"$ne": True}, "tracking_since": since},
+            exposure_backfill_update(history, since, now)
+        )
+        if result.matched_count:
+            break
+    return await db.child_exposure.find_one({"child_id": child_id}, {"_id": 0})
+
+def exposure_backfill_update(history: dict, since: Optional[str], now: str) -> dict:
+    if since:
+        increments = {
+            "total_activities": history["total_activities"],
+            "rating_total": history["rating_total"],
+            "rating_count": history["rating_count"],
+            **{f"intelligence_counts.{key}": count for key, count in history["intelligence_counts"].items()},
+            **{f"subject_counts.{key}": count for key, count in history["subject_counts"].items()}
+        }
+        return {
+            "$inc": increments,
+            "$addToSet": {"skills": {"$each": history["skills"]}},
+            "$set": {"initialized": True, "updated_at": now}
+        }
+    # Aggregates written before tracking_since existed cannot be split, so they are recounted
+    return {"$set": {**history, "initialized": True, "tracking_since": now, "updated_at": now}}
+
+# ============ Exposure Trends ============
+def trend_bucket_stage(interval: str) -> dict:
+    # created_at is stored as an ISO string, so convert before truncating to the bucket
+    return {"$dateTrunc": {
+        "date": {"$dateFromString": {"dateString": "$created_at"}},
+        "unit": interval,
+        "startOfWeek": "monday"
+    }}
+
+def trend_match_stage(child_id: str, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    match = {"child_id": child_id}
+    created_at = {}
+    if start:
+        created_at["$gte"] = start.astimezone(timezone.utc).isoformat()
+    if end:
+        created_at["$lt"] = end.astimezone(timezone.utc).isoformat()
+    if created_at:
+        match["created_at"] = created_at
+    return {"$match": match}
+
+async def aggregate_activity_trends(child_id: str, interval: str, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    def counts_by(field: str) -> List[dict]:
+        return [
+            {"$unwind": f"${field}"},
+            {"$group": {"_id": {"bucket": "$bucket", "name": f"${field}"}, "count": {"$sum": 1}}}
+        ]
+    
+    pipeline = [
+        trend_match_stage(child_id, start, end),
+        {"$project": {"_id": 0, "bucket": trend_bucket_stage(interval), "intelligences": 1, "subjects": 1}},
+        {"$facet": {
+            "totals": [{"$group": {"_id": "$bucket", "count": {"$sum": 1}}}],
+            "intelligences": counts_by("intelligences"),
+            "subjects": counts_by("subjects")
+        }}
+    ]
+    results = await db.activities.aggregate(pipeline).to_list(1)
+    return results[0] if results else {"totals": [], "intelligences": [], "subjects": []}
+
+async def aggregate_rating_trends(child_id: str, interval: str, start: Optional[datetime], end: Optional[datetime], rolling_window: int) -> List[dict]:
+    pipeline = [
+        trend_match_stage(child_id, start, end),
+        {"$group": {"_id": trend_bucket_stage(interval), "rating_total": {"$sum": "$rating"}, "ratings": {"$sum": 1}}},
+        {"$setWindowFields": {
+            "sortBy": {"_id": 1},
+            "output": {
+                "rolling_total": {"$sum": "$rating_total", "window": {"documents": [-(rolling_window - 1), 0]}},
+                "rolling_count": {"$sum": "$ratings", "window": {"documents": [-(rolling_window - 1), 0]}}
+            }
+        }}
+    ]
+    return await db.feedbacks.aggregate(pipeline).to_list(None)
+
+# ============ Generation Cache ============
+generation_cache_memory = TTLCache(maxsize=GENERATION_CACHE_MEMORY_SIZE, ttl=GENERATION_CACHE_TTL_SECONDS)
+generation_cache_stats = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "bypassed": 0}
+
+def normalize_activity_input(input_data: ActivityInput) -> dict:
+    def normalize_list(values: List[str]) -> List[str]:
+        return sorted({value.strip().casefold() for value in values if value.strip()})
+    
+    return {
+        "age": input_data.age,
+        "subjects": normalize_list(input_data.subjects),
+        "intelligences": normalize_list(input_data.intelligences),
+        "tools": normalize_list(input_data.tools)
+    }
+
+def generation_cache_key(input_data: ActivityInput) -> str:
+    normalized = json.dumps(normalize_activity_input(input_data), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+async def lookup_generation_cache(cache_key: str) -> Optional[dict]:
+    cached = generation_cache_memory.get(cache_key)
+    if cached is not None:
+        generation_cache_stats["memory_hits"] += 1
+        return cached
+    
+    try:
+        entry = await db.generation_cache.find_one(
+            {"key": cache_key, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            {"_id": 0, "ai_response": 1}
+        )
+    except Exception as e:
+        logger.error(f"Error reading generation cache: {str(e)}")
+        entry = None
+    
+    if entry:
+        generation_cache_stats["mongo_hits"] += 1
+        generation_cache_memory[cache_key] = entry["ai_response"]
+        return entry["ai_response"]
+    
+    generation_cache_stats["misses"] += 1
+    return None
+
+async def store_generation_cache(cache_key: str, ai_response: dict):
+    generation_cache_memory[cache_key] = ai_response
+    now = datetime.now(timezone.utc)
+    try:
+        await db.generation_cache.update_one(
+            {"key": cache_key},
+            {"$set": {
+                "key": cache_key,
+                "ai_response": ai_response,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=GENERATION_CACHE_TTL_SECONDS)
+            }},
+            upsert=True
+        )
+    except Exception as e:
+        logger.error(f"Error writing generation cache: {str(e)}")
+
+def build_activity(input_data: ActivityInput, ai_response: dict) -> Activity:
+    content = ActivityContent(**ai_response)
+    return Activity(
+        child_id=input_data.child_id,
+        age=input_data.age,
+        subjects=input_data.subjects,
+        intelligences=input_data.intelligences,
+        tools=input_data.tools,
+        **content.model_dump()
+    )
+
+async def save_generated_activity(input_data: ActivityInput, ai_response: dict, cache_key: Optional[str] = None) -> dict:
+    activity = build_activity(input_data, ai_response)
+    
+    if cache_key:
+        await store_generation_cache(cache_key, ai_response)
+    
+    doc = activity.model_dump()
+    doc['created_at'] = doc['created_at'].isoformat()
+    await db.activities.insert_one(doc)
+    doc.pop('_id', None)
+    await record_activity_exposure([doc])
+    similarity_index.add(doc)
+    return doc
+
+async def resolve_ai_response(input_data: ActivityInput, fresh: bool = False) -> Tuple[dict, Optional[str]]:
+    # Returns the generated content and, for fresh generations, the cache key to store it under
+    cache_key = generation_cache_key(input_data)
+    record_generation_demand(cache_key, input_data)
+    if fresh:
+        generation_cache_stats["bypassed"] += 1
+    else:
+        ai_response = await lookup_generation_cache(cache_key)
+        if ai_response is not None:
+            return ai_response, None
+    
+    ai_response = await take_from_stock(cache_key)
+    if ai_response is not None:
+        return ai_response, cache_key
+    
+    async with track_user_generation():
+        ai_response = await generate_activity_with_ai(input_data)
+    return ai_response, cache_key
+
+async def generate_and_store_activity(input_data: ActivityInput, fresh: bool = False) -> dict:
+    ai_response, cache_key = await resolve_ai_response(input_data, fresh=fresh)
+    return await save_generated_activity(input_data, ai_response, cache_key)
+
+# ============ Batch Generation ============
+async def generate_batch_item(index: int, input_data: ActivityInput, fresh: bool, semaphore: asyncio.Semaphore) -> dict:
+    async with semaphore:
+        try:
+            ai_response, cache_key = await resolve_ai_response(input_data, fresh=fresh)
+            activity = build_activity(input_data, ai_response)
+            doc = activity.model_dump()
+            doc['created_at'] = doc['created_at'].isoformat()
+            return {"index": index, "doc": doc, "ai_response": ai_response, "cache_key": cache_key}
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"Error generating batch item {index}: {error}")
+            return {"index": index, "error": error}
+
+# ============ Similarity Index ============
+SIMILARITY_LABEL_FIELDS = ("subjects", "intelligences", "tools")
+SIMILARITY_FIELD_WEIGHTS = {"subjects": 0.3, "intelligences": 0.3, "tools": 0.15, "age": 0.25}
+SIMILARITY_TEXT_FIELDS = ("title", "description", "objective", "skills", "materials_required")
+SIMILARITY_STOPWORDS = frozenset(
+    "the and for with that this from into your their are was were will can has have how what when "
+    "who why which while about using use each more than then them they its our out all any".split()
+)
+
+def tokenize_similarity_text(text: str) -> List[str]:
+    return [token for token in re.findall(r"[a-z0-9]+", text.casefold()) if len(token) > 2 and token not in SIMILARITY_STOPWORDS]
+
+class ActivitySimilarityIndex:
+    # Multi-hot label matrix plus an inverted TF-IDF index over activity text, grown in place
+    # as activities are added. The label matrix is stored column-wise (the rows carrying each
+    # label) so scoring touches only the queried labels. Documents use normalized log-tf weights
+    # and queries carry the idf (SMART lnc.ltc), so nothing is re-weighted as the corpus grows.
+    def __init__(self, capacity: int = 1024):
+        self.ids: List[str] = []
+        self.rows = {}
+        self.ages = np.zeros(capacity, dtype=np.int16)
+        self.label_columns = {field: {} for field in SIMILARITY_LABEL_FIELDS}
+        self.column_fields: List[str] = []
+        self.label_rows = {}
+        self.label_row_arrays = {}
+        self.row_labels: List[List[int]] = []
+        self.label_counts = np.zeros((capacity, len(SIMILARITY_LABEL_FIELDS)), dtype=np.int16)
+        self.postings = {}
+        self.posting_arrays = {}
+        self.ready = False
+        self.last_created_at = ""
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def _grow_rows(self):
+        capacity = self.ages.shape[0] * 2
+        self.ages = np.resize(self.ages, capacity)
+        self.label_counts = np.vstack([self.label_counts, np.zeros_like(self.label_counts)])
+    
+    def _label_column(self, field: str, label: str) -> int:
+        columns = self.label_columns[field]
+        if label not in columns:
+            column = len(self.column_fields)
+            columns[label] = column
+            self.label_rows[column] = []
+            self.column_fields.append(field)
+        return columns[label]
+    
+    def add(self, activity: dict):
+        if activity["id"] in self.rows:
+            return
+        row = len(self.ids)
+        if row >= self.ages.shape[0]:
+            self._grow_rows()
+        
+        self.ids.append(activity["id"])
+        self.rows[activity["id"]] = row
+        self.ages[row] = activity.get("age", 0)
+        
+        row_columns = []
+        for field_index, field in enumerate(SIMILARITY_LABEL_FIELDS):
+            labels = {label.strip().casefold() for label in activity.get(field, []) if label.strip()}
+            for label in labels:
+                column = self._label_column(field, label)
+                self.label_rows[column].append(row)
+                self.label_row_arrays.pop(column, None)
+                row_columns.append(column)
+            self.label_counts[row, field_index] = len(labels)
+        self.row_labels.append(row_columns)
+        
+        term_counts = {}
+        for field in SIMILARITY_TEXT_FIELDS:
+            value = activity.get(field) or ""
+            text = " ".join(value) if isinstance(value, list) else str(value)
+            for token in tokenize_similarity_text(text):
+                term_counts[token] = term_counts.get(token, 0) + 1
+        
+        weights = {term: 1 + math.log(count) for term, count in term_counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        for term, weight in weights.items():
+            rows, values = self.postings.setdefault(term, ([], []))
+            rows.append(row)
+            values.append(weight / norm)
+            self.posting_arrays.pop(term, None)
+        
+        if activity.get("created_at", "") > self.last_created_at:
+            self.last_created_at = activity["created_at"]
+    
+    def _label_array(self, column: int) -> np.ndarray:
+        if column not in self.label_row_arrays:
+            self.label_row_arrays[column] = np.asarray(self.label_rows[column], dtype=np.int32)
+        return self.label_row_arrays[column]
+    
+    def _posting_array(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        if term not in self.posting_arrays:
+            rows, values = self.postings[term]
+            self.posting_arrays[term] = (np.asarray(rows, dtype=np.int32), np.asarray(values, dtype=np.float32))
+        return self.posting_arrays[term]
+    
+    def text_scores(self, text: str) -> np.ndarray:
+        count = len(self.ids)
+        scores = np.zeros(count, dtype=np.float32)
+        term_counts = {}
+        for token in tokenize_similarity_text(text):
+            if token in self.postings:
+                term_counts[token] = term_counts.get(token, 0) + 1
+        if not term_counts:
+            return scores
+        
+        query_weights = {
+            term: (1 + math.log(tf)) * math.log(count / len(self.postings[term][0]) + 1)
+            for term, tf in term_counts.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in query_weights.values())) or 1.0
+        for term, weight in query_weights.items():
+            rows, values = self._posting_array(term)
+            # A term has at most one posting per activity, so plain fancy-indexed addition is safe
+            scores[rows] += values * (weight / norm)
+        return scores
+    
+    def attribute_scores(self, age: int, labels_by_field: dict) -> np.ndarray:
+        count = len(self.ids)
+        scores = np.zeros(count, dtype=np.float32)
+        for field_index, field in enumerate(SIMILARITY_LABEL_FIELDS):
+            query_labels = {label.strip().casefold() for label in labels_by_field.get(field, []) if label.strip()}
+            intersection = np.zeros(count, dtype=np.float32)
+            for label in query_labels:
+                if label in self.label_columns[field]:
+                    intersection[self._label_array(self.label_columns[field][label])] += 1
+            union = self.label_counts[:count, field_index].astype(np.float32) + len(query_labels) - intersection
+            jaccard = np.divide(intersection, union, out=np.zeros(count, dtype=np.float32), where=union > 0)
+            scores += SIMILARITY_FIELD_WEIGHTS[field] * jaccard
+        
+        scores += SIMILARITY_FIELD_WEIGHTS["age"] * self.age_scores(age)
+        return scores
+    
+    def age_scores(self, age: int) -> np.ndarray:
+        age_distance = np.abs(self.ages[:len(self.ids)].astype(np.float32) - age)
+        return np.clip(1 - age_distance / SIMILARITY_AGE_TOLERANCE, 0, 1)
+    
+    def label_scores(self, field_weights: dict, column_weights: dict) -> np.ndarray:
+        # Mean weight of each activity's labels within the given fields. Every label starts at its
+        # field's default and only the overridden columns are gathered, so the cost tracks the
+        # query rather than the label vocabulary.
+        count = len(self.ids)
+        field_indexes = [SIMILARITY_LABEL_FIELDS.index(field) for field in field_weights]
+        label_counts = self.label_counts[:count, field_indexes].astype(np.float32)
+        totals = label_counts @ np.asarray(list(field_weights.values()), dtype=np.float32)
+        
+        for column, weight in column_weights.items():
+            field = self.column_fields[column]
+            if field in field_weights and weight != field_weights[field]:
+                totals[self._label_array(column)] += weight - field_weights[field]
+        
+        label_totals = label_counts.sum(axis=1)
+        return np.divide(totals, label_totals, out=np.zeros(count, dtype=np.float32), where=label_totals > 0)
+    
+    def row_label_columns(self, row: int) -> List[int]:
+        return self.row_labels[row]
+    
+    def search(self, input_data: ActivityInput, k: int) -> List[Tuple[str, float]]:
+        if not self.ids:
+            return []
+        labels_by_field = {field: getattr(input_data, field) for field in SIMILARITY_LABEL_FIELDS}
+        query_text = " ".join(input_data.subjects + input_data.intelligences + input_data.tools)
+        scores = (
+            (1 - SIMILARITY_TEXT_WEIGHT) * self.attribute_scores(input_data.age, labels_by_field)
+            + SIMILARITY_TEXT_WEIGHT * self.text_scores(query_text)
+        )
+        
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top]
+
+SIMILARITY_PROJECTION = {"_id": 0, "id": 1, "age": 1, "created_at": 1, **{field: 1 for field in SIMILARITY_LABEL_FIELDS + SIMILARITY_TEXT_FIELDS}}
+similarity_index = ActivitySimilarityIndex()
+similarity_worker: Optional[asyncio.Task] = None
+
+async def refresh_similarity_index():
+    # Picks up activities inserted by other processes since the newest one already indexed.
+    # created_at is stamped before the insert, so the watermark is rewound by an overlap window
+    # and rows that are already indexed are skipped by add()
+    query = {}
+    if similarity_index.last_created_at:
+        since = datetime.fromisoformat(similarity_index.last_created_at) - timedelta(seconds=SIMILARITY_REFRESH_OVERLAP_SECONDS)
+        query = {"created_at": {"$gte": since.isoformat()}}
+    async for activity in db.activities.find(query, SIMILARITY_PROJECTION).sort("created_at", 1):
+        similarity_index.add(activity)
+
+async def run_similarity_index():
+    while True:
+        try:
+            await refresh_similarity_index()
+            if not similarity_index.ready:
+                similarity_index.ready = True
+                logger.info(f"Similarity index ready with {len(similarity_index)} activities")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error refreshing similarity index: {str(e)}")
+        await asyncio.sleep(SIMILARITY_REFRESH_SECONDS)
+
+# ============ Recommendations ============
+EXPOSURE_GAP_FIELD_WEIGHTS = {"intelligences": 1.0, "subjects": 0.5}
+
+def exposure_gap_weights(exposure: dict) -> dict:
+    # Labels the child has never met keep their full field weight; seen ones fade with exposure
+    weights = {}
+    for field, counts_key in (("intelligences", "intelligence_counts"), ("subjects", "subject_counts")):
+        columns = similarity_index.label_columns[field]
+        for label, count in decode_exposure_counts(exposure.get(counts_key)).items():
+            column = columns.get(label.strip().casefold())
+            if column is not None:
+                weights[column] = EXPOSURE_GAP_FIELD_WEIGHTS[field] / (1 + count)
+    return weights
+
+def rating_affinity_weights(rated_rows: List[Tuple[int, int]]) -> dict:
+    # Average centered rating (1..5 mapped to -1..1) of the rated activities carrying each label
+    totals = {}
+    counts = {}
+    for row, rating in rated_rows:
+        centered = (min(max(rating, 1), 5) - 3) / 2
+        for column in similarity_index.row_label_columns(row):
+            totals[column] = totals.get(column, 0.0) + centered
+            counts[column] = counts.get(column, 0) + 1
+    return {column: totals[column] / counts[column] for column in totals}
+
+def score_recommendations(child: dict, exposure: dict, rated_rows: List[Tuple[int, int]], seen_rows: List[int], limit: int) -> List[Tuple[int, float, dict]]:
+    components = {
+        "exposure_gap": similarity_index.label_scores(EXPOSURE_GAP_FIELD_WEIGHTS, exposure_gap_weights(exposure)),
+        "age_fit": similarity_index.age_scores(child["age"]),
+        "interests": similarity_index.text_scores(" ".join(child.get("interests", []))),
+        "rating_affinity": similarity_index.label_scores(dict.fromkeys(SIMILARITY_LABEL_FIELDS, 0.0), rating_affinity_weights(rated_rows))
+    }
+    scores = sum(RECOMMENDATION_WEIGHTS[name] * values for name, values in components.items())
+    
+    # Activities outside the age tolerance or already done by the child are never recommended
+    scores[components["age_fit"] <= 0] = -np.inf
+    if seen_rows:
+        scores[seen_rows] = -np.inf
+    
+    candidates = int(np.isfinite(scores).sum())
+    limit = min(limit, candidates)
+    if limit == 0:
+        return []
+    top = np.argpartition(-scores, limit - 1)[:limit]
+    top = top[np.argsort(-scores[top])]
+    return [
+        (int(row), float(scores[row]), {name: round(float(values[row]), 4) for name, values in components.items()})
+        for row in top
+    ]
+
+# ============ Pre-generation Pool ============
+pregeneration_state = {"active_user_generations": 0, "last_user_generation_at": 0.0, "budget_window_start": 0.0, "budget_tokens_used": 0}
+pregeneration_stats = {"stock_hits": 0, "stock_misses": 0, "generated": 0, "failures": 0, "tokens_used": 0, "budget_exhausted": 0}
+pregeneration_wakeup = asyncio.Event()
+pregeneration_worker: Optional[asyncio.Task] = None
+
+@asynccontextmanager
+async def track_user_generation():
+    pregeneration_state["active_user_generations"] += 1
+    try:
+        yield
+    finally:
+        pregeneration_state["active_user_generations"] -= 1
+        pregeneration_state["last_user_generation_at"] = time.monotonic()
+
+def record_generation_demand(cache_key: str, input_data: ActivityInput):
+    if not PREGENERATION_ENABLED:
+        return
+    spawn_background(db.generation_demand.update_one(
+        {"key": cache_key},
+        {
+            "$inc": {"count": 1},
+            "$set": {
+                "input": input_data.model_dump(exclude={"child_id"}),
+                "last_requested_at": datetime.now(timezone.utc)
+            }
+        },
+        upsert=True
+    ))
+
+async def take_from_stock(cache_key: str) -> Optional[dict]:
+    if not PREGENERATION_ENABLED:
+        return None
+    try:
+        # find_one_and_delete guarantees each stocked activity is served at most once
+        stocked = await db.generation_stock.find_one_and_delete({"key": cache_key}, sort=[("created_at", 1)])
+    except Exception as e:
+        logger.error(f"Error reading pre-generation stock: {str(e)}")
+        return None
+    
+    if not stocked:
+        pregeneration_stats["stock_misses"] += 1
+        return None
+    
+    pregeneration_stats["stock_hits"] += 1
+    pregeneration_wakeup.set()
+    return stocked["ai_response"]
+
+def pregeneration_budget_left() -> int:
+    now = time.monotonic()
+    if now - pregeneration_state["budget_window_start"] >= 3600:
+        pregeneration_state["budget_window_start"] = now
+        pregeneration_state["budget_tokens_used"] = 0
+    return PREGENERATION_TOKEN_BUDGET_PER_HOUR - pregeneration_state["budget_tokens_used"]
+
+def is_generation_idle() -> bool:
+    return (
+        pregeneration_state["active_user_generations"] == 0
+        and time.monotonic() - pregeneration_state["last_user_generation_at"] >= PREGENERATION_IDLE_SECONDS
+    )
+
+async def find_understocked_combination() -> Optional[dict]:
+    since = datetime.now(timezone.utc) - timedelta(days=PREGENERATION_DEMAND_WINDOW_DAYS)
+    hot = await db.generation_demand.find(
+        {"last_requested_at": {"$gte": since}},
+        {"_id": 0, "key": 1, "input": 1}
+    ).sort("count", -1).limit(PREGENERATION_HOT_COMBINATIONS).to_list(PREGENERATION_HOT_COMBINATIONS)
+    
+    for combination in hot:
+        stocked = await db.generation_stock.count_documents({"key": combination["key"]})
+        if stocked < PREGENERATION_STOCK_PER_COMBINATION:
+            return combination
+    return None
+
+async def pregenerate_one() -> bool:
+    # Returns whether anything was generated, so the caller knows to look for more work
+    if pregeneration_budget_left() <= 0:
+        pregeneration_stats["budget_exhausted"] += 1
+        return False
+    
+    combination = await find_understocked_combination()
+    if not combination:
+        return False
+    
+    input_data = ActivityInput(**combination["input"])
+    try:
+        ai_response = await generate_activity_with_ai(input_data)
+    except Exception as e:
+        pregeneration_stats["failures"] += 1
+        logger.error(f"Error pre-generating activity: {str(e)}")
+        return False
+    
+    tokens = estimate_tokens(build_activity_prompt(input_data)) + estimate_tokens(json.dumps(ai_response))
+    pregeneration_state["budget_tokens_used"] += tokens
+    pregeneration_stats["tokens_used"] += tokens
+    pregeneration_stats["generated"] += 1
+    
+    await db.generation_stock.insert_one({
+        "id": str(uuid.uuid4()),
+        "key": combination["key"],
+        "ai_response": ai_response,
+        "created_at": datetime.now(timezone.utc)
+    })
+    return True
+
+async def run_pregeneration():
+    while True:
+        try:
+            try:
+                await asyncio.wait_for(pregeneration_wakeup.wait(), timeout=PREGENERATION_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            pregeneration_wakeup.clear()
+            
+            # Fill one activity at a time and re-check idleness between each
+            while is_generation_idle() and await pregenerate_one():
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Pre-generation scheduler error: {str(e)}")
+
+# ============ Generation Jobs ============
+generation_job_wakeup = asyncio.Event()
+generation_workers: List[asyncio.Task] = []
+
+async def update_generation_job(job: dict, **fields):
+    # Guarded by the lease so a worker whose lease lapsed cannot overwrite the job's new owner
+    fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+    await db.generation_jobs.update_one({"id": job["id"], "lease_id": job["lease_id"]}, {"$set": fields})
+
+async def claim_generation_job() -> Optional[dict]:
+    now = datetime.now(timezone.utc).isoformat()
+    return await db.generation_jobs.find_one_and_update(
+        # Jobs without available_at predate retry backoff and are always eligible
+        {"status": "queued", "available_at": {"$not": {"$gt": now}}},
+        {
+            "$set": {"status": "running", "stage": "generating", "progress": 10, "lease_id": str(uuid.uuid4()), "updated_at": now},
+            "$inc": {"attempts": 1}
+        },
+        sort=[("created_at", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def requeue_expired_generation_jobs() -> int:
+    # Running jobs renew updated_at while their worker is alive, so a stale one lost its worker
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(seconds=GENERATION_JOB_LEASE_SECONDS)).isoformat()
+    result = await db.generation_jobs.update_many(
+        {"status": "running", "updated_at": {"$lt": cutoff}},
+        {
+            "$set": {"status": "queued", "stage": "requeued", "progress": 0, "available_at": now.isoformat(), "updated_at": now.isoformat()},
+            "$unset": {"lease_id": ""}
+        }
+    )
+    return result.modified_count
+
+async def renew_generation_job_lease(job: dict):
+    while True:
+        await asyncio.sleep(GENERATION_JOB_LEASE_SECONDS / 4)
+        try:
+            await db.generation_jobs.update_one(
+                {"id": job["id"], "lease_id": job["lease_id"], "status": "running"},
+                {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
+            )
+        except Exception as e:
+            logger.error(f"Error renewing lease for generation job {job['id']}: {str(e)}")
+
+async def run_generation_job(job: dict):
+    heartbeat = asyncio.create_task(renew_generation_job_lease(job))
+    try:
+        input_data = ActivityInput(**job["input"])
+        doc = await generate_and_store_activity(input_data, fresh=job.get("fresh", False))
+        await update_generation_job(job, status="completed", stage="completed", progress=100, activity_id=doc["id"], error=None)
+    except Exception as e:
+        error = e.detail if isinstance(e, HTTPException) else str(e)
+        logger.error(f"Error running generation job {job['id']}: {error}")
+        attempts = job.get("attempts", 1)
+        if attempts < GENERATION_JOB_MAX_ATTEMPTS:
+            retry_at = datetime.now(timezone.utc) + timedelta(seconds=GENERATION_JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1))
+            await update_generation_job(job, status="queued", stage="retrying", progress=0, error=error, available_at=retry_at.isoformat())
+        else:
+            await update_generation_job(job, status="failed", stage="failed", progress=100, error=error)
+    finally:
+        heartbeat.cancel()
+
+async def generation_worker(worker_index: int):
+    while True:
+        try:
+            job = await claim_generation_job()
+            if job:
+                await run_generation_job(job)
+                continue
+            
+            # One worker per process sweeps for jobs whose worker died without finishing them
+            if worker_index == 0 and await requeue_expired_generation_jobs():
+                continue
+            
+            generation_job_wakeup.clear()
+            try:
+                await asyncio.wait_for(generation_job_wakeup.wait(), timeout=GENERATION_JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Generation worker {worker_index} error: {str(e)}")
+            await asyncio.sleep(GENERATION_JOB_POLL_SECONDS)
+
+# ============ Streaming Generation ============
+# Reports each top-level field of a streamed JSON object, and each element of a
+# top-level array, as soon as its closing token arrives
+class IncrementalActivityParser:
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.started = False
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.expect_value = False
+        self.key_start = None
+        self.current_key = None
+        self.value_start = None
+        self.array_value = False
+        self.item_start = None
+        self.item_index = 0
+    
+    def feed(self, chunk: str) -> List[dict]:
+        self.buffer += chunk
+        events = []
+        
+        while self.position < len(self.buffer) and not self.done:
+            index = self.position
+            char = self.buffer[index]
+            self.position += 1
+            
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self.depth = 1
+                continue
+            
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1 and not self.expect_value:
+                        self.current_key = json.loads(self.buffer[self.key_start:index + 1])
+                    elif self.depth == 1 and self.value_start is not None:
+                        self._emit_field(events, self.buffer[self.value_start:index + 1])
+                    elif self.depth == 2 and self.array_value and self.item_start is not None:
+                        self._emit_item(events, self.buffer[self.item_start:index + 1])
+                continue
+            
+            if char.isspace():
+                continue
+            
+            if char == '"':
+                self.in_string = True
+                if self.depth == 1 and not self.expect_value:
+                    self.key_start = index
+                elif self.depth == 1 and self.value_start is None:
+                    self.value_start = index
+                elif self.depth == 2 and self.array_value and self.item_start is None:
+                    self.item_start = index
+            elif char == ":" and self.depth == 1:
+                self.expect_value = True
+            elif char == ",":
+                if self.depth == 1:
+                    if self.value_start is not None:
+                        self._emit_field(events, self.buffer[self.value_start:index])
+                    self.expect_value = False
+                elif self.depth == 2 and self.array_value and self.item_start is not None:
+                    self._emit_item(events, self.buffer[self.item_start:index])
+            elif char in "{[":
+                if self.depth == 1 and self.value_start is None:
+                    self.value_start = index
+                    self.array_value = char == "["
+                    self.item_index = 0
+                elif self.depth == 2 and self.array_value and self.item_start is None:
+                    self.item_start = index
+                self.depth += 1
+            elif char in "}]":
+                if self.depth == 2 and self.array_value and self.item_start is not None:
+                    self._emit_item(events, self.buffer[self.item_start:index])
+                self.depth -= 1
+                if self.depth == 2 and self.array_value and self.item_start is not None:
+                    self._emit_item(events, self.buffer[self.item_start:index + 1])
+                elif self.depth == 1 and self.value_start is not None:
+                    self._emit_field(events, self.buffer[self.value_start:index + 1])
+                elif self.depth == 0:
+                    if self.value_start is not None:
+                        self._emit_field(events, self.buffer[self.value_start:index])
+                    self.done = True
+            elif self.depth == 1 and self.expect_value and self.value_start is None:
+                self.value_start = index
+            elif self.depth == 2 and self.array_value and self.item_start is None:
+                self.item_start = index
+        
+        return events
+    
+    def _emit_field(self, events: List[dict], raw: str):
+        try:
+            events.append({"field": self.current_key, "value": json.loads(raw.strip())})
+        except ValueError:
+            logger.error(f"Could not parse streamed field {self.current_key}")
+        self.value_start = None
+        self.array_value = False
+    
+    def _emit_item(self, events: List[dict], raw: str):
+        try:
+            events.append({"field": self.current_key, "index": self.item_index, "value": json.loads(raw.strip())})
+        except ValueError:
+            logger.error(f"Could not parse streamed item {self.current_key}[{self.item_index}]")
+        self.item_index += 1
+        self.item_start = None
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_activity_with_ai(input_data: ActivityInput) -> AsyncIterator[str]:
+    # The per-attempt deadline applies between tokens, so a stalled stream fails instead of
+    # holding the connection until the provider's overall timeout
+    stream = get_ai_provider().stream(ACTIVITY_SYSTEM_MESSAGE, build_activity_prompt(input_data))
+    try:
+        while True:
+            try:
+                delta = await asyncio.wait_for(stream.__anext__(), timeout=LLM_ATTEMPT_TIMEOUT_SECONDS)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"LLM stream stalled for more than {LLM_ATTEMPT_TIMEOUT_SECONDS:g}s")
+            yield delta
+    finally:
+        await stream.aclose()
+
+async def stream_generated_activity(input_data: ActivityInput, fresh: bool) -> AsyncIterator[str]:
+    try:
+        cache_key = generation_cache_key(input_data)
+        record_generation_demand(cache_key, input_data)
+        ai_response = None
+        if fresh:
+            generation_cache_stats["bypassed"] += 1
+        else:
+            ai_response = await lookup_generation_cache(cache_key)
+        
+        cache_hit = ai_response is not None
+        if not cache_hit:
+            ai_response = await take_from_stock(cache_key)
+        
+        if ai_response is not None:
+            for field, value in ai_response.items():
+                yield format_sse("field", {"field": field, "value": value})
+        else:
+            parser = IncrementalActivityParser()
+            chunks = []
+            async with track_user_generation():
+                async for delta in stream_activity_with_ai(input_data):
+                    chunks.append(delta)
+                    for event in parser.feed(delta):
+                        yield format_sse("item" if "index" in event else "field", event)
+            ai_response = await validate_activity_content("".join(chunks))
+        
+        doc = await save_generated_activity(input_data, ai_response, None if cache_hit else cache_key)
+        
+        yield format_sse("activity", ActivityResponse(**doc).model_dump())
+        yield format_sse("done", {"id": doc["id"]})
+        
+    except Exception as e:
+        logger.error(f"Error streaming activity: {str(e)}")
+        yield format_sse("error", {"detail": str(e)})
+
+# ============ Binary Streaming ============
+def parse_byte_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    # Only single ranges are served; anything malformed falls back to the full body
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    
+    start_str, _, end_str = range_header[6:].split(",")[0].strip().partition("-")
+    try:
+        if start_str == "":
+            suffix_length = int(end_str)
+            if suffix_length <= 0:
+                return None
+            start, end = max(size - suffix_length, 0), size - 1
+        else:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+            if end_str and end < start:
+                # An invalid range spec (RFC 9110 14.1.1) is ignored, not refused
+                return None
+            end = min(end, size - 1)
+    except ValueError:
+        return None
+    
+    if start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+async def iter_bytes_range(data: bytes, start: int, end: int) -> AsyncIterator[bytes]:
+    for offset in range(start, end + 1, STREAM_CHUNK_SIZE):
+        yield data[offset:min(offset + STREAM_CHUNK_SIZE, end + 1)]
+
+async def iter_grid_out_range(grid_out, start: int, end: int) -> AsyncIterator[bytes]:
+    grid_out.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = await grid_out.read(min(STREAM_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+def build_range_response(request: Request, size: int, etag: str, media_type: str, body_factory, headers: Optional[dict] = None) -> Response:
+    response_headers = {"Accept-Ranges": "bytes", "ETag": f'"{etag}"', **(headers or {})}
+    if request.headers.get("if-none-match") == response_headers["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=response_headers)
+    
+    byte_range = parse_byte_range(request.headers.get("range"), size)
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, status.HTTP_200_OK
+    else:
+        start, end = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    
+    response_headers["Content-Length"] = str(max(end - start + 1, 0))
+    return StreamingResponse(body_factory(start, end), status_code=status_code, media_type=media_type, headers=response_headers)
+
+def content_disposition(disposition: str, filename: Optional[str]) -> str:
+    # Header values are latin-1 encoded, so non-ASCII names go in filename* (RFC 6266) with an
+    # ASCII fallback for older clients; quotes and control characters never reach the header
+    filename = filename or "download"
+    fallback = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii")
+    fallback = "".join("_" if char in '"\\' or not char.isprintable() else char for char in fallback).strip() or "download"
+    return f"{disposition}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+# ============ Artifact Storage ============
+async def store_artifact_blob(file: UploadFile, metadata: dict) -> dict:
+    # Copies the upload into GridFS chunk by chunk, hashing as it goes, then
+    # collapses the new blob onto an existing one with the same content
+    digest = hashlib.sha256()
+    size = 0
+    grid_in = artifact_bucket.open_upload_stream(file.filename or "artifact", metadata=metadata)
+    try:
+        while True:
+            chunk = await file.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > ARTIFACT_MAX_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Artifact exceeds the {ARTIFACT_MAX_BYTES // (1024 * 1024)} MB limit"
+                )
+            digest.update(chunk)
+            await grid_in.write(chunk)
+    except BaseException:
+        await grid_in.abort()
+        raise
+    
+    sha256 = digest.hexdigest()
+    await grid_in.set("sha256", sha256)
+    await grid_in.close()
+    
+    # The oldest blob is canonical for every uploader, so concurrent identical uploads agree on
+    # which copy survives and never delete each other's
+    canonical = await db["artifact_blobs.files"].find_one(
+        {"sha256": sha256},
+        {"_id": 1},
+        sort=[("uploadDate", ASCENDING), ("_id", ASCENDING)]
+    )
+    if canonical and canonical["_id"] != grid_in._id:
+        await artifact_bucket.delete(grid_in._id)
+        return {"blob_id": str(canonical["_id"]), "sha256": sha256, "size": size}
+    
+    return {"blob_id": str(grid_in._id), "sha256": sha256, "size": size}
+
+class ArtifactUploadLimitMiddleware:
+    # Form bodies are spooled before the route runs, so oversized uploads that declare their
+    # length are refused up front; chunked uploads are still capped in store_artifact_blob
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == "/api/artifacts":
+            content_length = Headers(scope=scope).get("content-length", "")
+            if content_length.isdigit() and int(content_length) > ARTIFACT_MAX_BYTES + ARTIFACT_FORM_OVERHEAD_BYTES:
+                response = ORJSONResponse(
+                    {"detail": f"Artifact exceeds the {ARTIFACT_MAX_BYTES // (1024 * 1024)} MB limit"},
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+def artifact_content_headers(content_type: str, filename: Optional[str]) -> dict:
+    # Uploaded content types come from the client; never let the browser sniff or run them
+    inline = content_type.split(";")[0].strip().lower() in ARTIFACT_INLINE_CONTENT_TYPES
+    return {
+        "Cache-Control": "private, max-age=86400",
+        "Content-Disposition": content_disposition("inline" if inline else "attachment", filename),
+        "Content-Security-Policy": "default-src 'none'; sandbox",
+        "X-Content-Type-Options": "nosniff"
+    }
+
+def artifact_content_url(artifact_id: str, variant: Optional[str] = None) -> str:
+    url = f"/api/artifacts/{artifact_id}/content"
+    return f"{url}?variant={variant}" if variant else url
+
+def artifact_response(artifact: dict) -> ArtifactResponse:
+    derivatives = artifact.get("derivatives") or {}
+    return ArtifactResponse(
+        **artifact,
+        content_url=artifact_content_url(artifact["id"]),
+        thumbnail_url=artifact_content_url(artifact["id"], "thumbnail") if "thumbnail" in derivatives else None,
+        preview_url=artifact_content_url(artifact["id"], "preview") if "preview" in derivatives else None
+    )
 
-Make it pedagogically sound, differentiated, and holistic."""
+# ============ Artifact Derivatives ============
+image_process_pool: Optional[ProcessPoolExecutor] = None
+
+def get_image_process_pool() -> ProcessPoolExecutor:
+    global image_process_pool
+    if image_process_pool is None:
+        image_process_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKER_PROCESSES)
+    return image_process_pool
+
+def render_image_derivatives(data: bytes) -> dict:
+    # Runs in a worker process; keep it free of event-loop and database state
+    rendered = {}
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
         
-        chat = LlmChat(
-            api_key=emergent_key,
-            session_id=f"activity_{uuid.uuid4()}",
-            system_message="You are an expert in educational program design with specialized knowledge of NCF-SE 2023 framework, National Institute of Open Schooling (NIOS) curriculum standards, NEP 2020, and Howard Gardner's Multiple Intelligences theory. You design pedagogically sound, differentiated learning activities for gifted and homeschooled children in India, ensuring alignment with national curricula while promoting holistic development. Always respond with valid JSON only."
+        for name, spec in ARTIFACT_DERIVATIVES.items():
+            derivative = image.copy()
+            derivative.thumbnail((spec["max_size"], spec["max_size"]), Image.LANCZOS)
+            if spec["format"] == "JPEG" and derivative.mode != "RGB":
+                derivative = derivative.convert("RGB")
+            
+            output = io.BytesIO()
+            derivative.save(output, format=spec["format"], quality=spec["quality"], optimize=True)
+            rendered[name] = {"data": output.getvalue(), "width": derivative.width, "height": derivative.height}
+    return rendered
+
+async def generate_artifact_derivatives(artifact_id: str):
+    try:
+        artifact = await db.artifacts.find_one({"id": artifact_id}, {"_id": 0, "blob_id": 1, "sha256": 1, "filename": 1})
+        if not artifact:
+            return
+        
+        # Identical uploads share a blob, so they can share its derivatives too
+        sibling = await db.artifacts.find_one(
+            {"sha256": artifact["sha256"], "derivatives_status": "ready", "id": {"$ne": artifact_id}},
+            {"_id": 0, "derivatives": 1}
         )
-        chat.with_model("openai", "gpt-4o")
+        if sibling:
+            await db.artifacts.update_one(
+                {"id": artifact_id},
+                {"$set": {"derivatives": sibling["derivatives"], "derivatives_status": "ready"}}
+            )
+            return
         
-        user_message = UserMessage(text=prompt)
-        response = await chat.send_message(user_message)
+        grid_out = await artifact_bucket.open_download_stream(ObjectId(artifact["blob_id"]))
+        data = await grid_out.read()
         
-        import json
-        response_text = response.strip()
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
+        loop = asyncio.get_running_loop()
+        rendered = await loop.run_in_executor(get_image_process_pool(), render_image_derivatives, data)
         
-        activity_data = json.loads(response_text.strip())
-        return activity_data
+        derivatives = {}
+        for name, output in rendered.items():
+            spec = ARTIFACT_DERIVATIVES[name]
+            blob_id = await artifact_bucket.upload_from_stream(
+                f"{artifact['filename']}.{name}",
+                output["data"],
+                metadata={"content_type": spec["content_type"], "derivative_of": artifact["blob_id"], "variant": name}
+            )
+            derivatives[name] = {
+                "blob_id": str(blob_id),
+                "content_type": spec["content_type"],
+                "size": len(output["data"]),
+                "width": output["width"],
+                "height": output["height"]
+            }
+        
+        await db.artifacts.update_one(
+            {"id": artifact_id},
+            {"$set": {"derivatives": derivatives, "derivatives_status": "ready"}}
+        )
         
     except Exception as e:
-        logger.error(f"Error generating activity: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to generate activity: {str(e)}")
+        logger.error(f"Error generating derivatives for artifact {artifact_id}: {str(e)}")
+        await db.artifacts.update_one({"id": artifact_id}, {"$set": {"derivatives_status": "failed"}})
+
+# ============ Audio Cache ============
+audio_generation_inflight = {}
+
+def build_audio_summary(activity: dict) -> str:
+    # Create concise summary for audio
+    summary_text = f"Activity: {activity['title']}. "
+    
+    if activity.get('objective'):
+        summary_text += f"Objective: {activity['objective']}. "
+    
+    summary_text += f"Description: {activity['description']}. "
+    
+    if activity.get('estimated_time'):
+        summary_text += f"Estimated time: {activity['estimated_time']}. "
+    
+    # Add materials
+    if activity.get('materials_required') and len(activity['materials_required']) > 0:
+        materials = ", ".join(activity['materials_required'][:5])
+        summary_text += f"Materials needed: {materials}. "
+    
+    # Add brief instructions overview
+    if len(activity['instructions']) > 0:
+        summary_text += f"This activity has {len(activity['instructions'])} steps. "
+        if len(activity['instructions']) <= 3:
+            summary_text += "Steps: " + ". ".join(activity['instructions'][:3]) + ". "
+        else:
+            summary_text += f"Key steps include: {activity['instructions'][0]}, and {activity['instructions'][1]}. "
+    
+    # Add expected outcome
+    if activity.get('expected_outcome'):
+        summary_text += f"Expected outcome: {activity['expected_outcome']}. "
+    
+    # Limit to 4096 characters for TTS API
+    if len(summary_text) > 4000:
+        summary_text = summary_text[:3997] + "..."
+    
+    return summary_text
+
+def audio_cache_key(text: str, model: str, voice: str, speed: float) -> str:
+    payload = json.dumps({"text": text, "model": model, "voice": voice, "speed": speed}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+async def load_cached_audio(cache_key: str) -> Optional[bytes]:
+    try:
+        stream = await audio_bucket.open_download_stream_by_name(cache_key)
+        return await stream.read()
+    except NoFile:
+        return None
+
+async def synthesize_and_cache_audio(cache_key: str, text: str) -> bytes:
+    started = time.perf_counter()
+    try:
+        audio_bytes = await get_ai_provider().synthesize(
+            text=text,
+            model=TTS_MODEL,
+            voice=TTS_VOICE,
+            speed=TTS_SPEED
+        )
+    except Exception:
+        tts_request_duration.observe(time.perf_counter() - started, TTS_MODEL, "error")
+        raise
+    tts_request_duration.observe(time.perf_counter() - started, TTS_MODEL, "ok")
+    tts_audio_bytes.observe(len(audio_bytes), TTS_MODEL)
+    
+    try:
+        await audio_bucket.upload_from_stream(
+            cache_key,
+            audio_bytes,
+            metadata={"model": TTS_MODEL, "voice": TTS_VOICE, "speed": TTS_SPEED, "content_type": "audio/mpeg"}
+        )
+    except Exception as e:
+        logger.error(f"Error caching audio: {str(e)}")
+    return audio_bytes
+
+async def get_activity_audio_bytes(text: str) -> Tuple[bytes, bool]:
+    # The key covers the summary text itself, so an edited activity never reuses stale audio
+    cache_key = audio_cache_key(text, TTS_MODEL, TTS_VOICE, TTS_SPEED)
+    audio_bytes = await load_cached_audio(cache_key)
+    if audio_bytes is not None:
+        return audio_bytes, True
+    
+    # Concurrent plays of the same uncached summary share one TTS call
+    task = audio_generation_inflight.get(cache_key)
+    if task is None:
+        task = asyncio.ensure_future(synthesize_and_cache_audio(cache_key, text))
+        audio_generation_inflight[cache_key] = task
+        task.add_done_callback(lambda _: audio_generation_inflight.pop(cache_key, None))
+    return await asyncio.shield(task), False
 
 # ============ Authentication Routes ============
 @api_router.post("/auth/signup", response_model=TokenResponse)
@@ -327,14 +2609,18 @@ async def signup(user_data: UserSignup):
         user = User(
             name=user_data.name,
             email=user_data.email,
-            password_hash=hash_password(user_data.password)
+            password_hash=await hash_password(user_data.password)
         )
         
         doc = user.model_dump()
         doc['created_at'] = doc['created_at'].isoformat()
-        await db.users.insert_one(doc)
+        try:
+            await db.users.insert_one(doc)
+        except DuplicateKeyError:
+            # A concurrent signup with the same email won the unique index
+            raise HTTPException(status_code=400, detail="Email already registered")
         
-        access_token = create_access_token(data={"sub": user.id})
+        access_token = create_access_token(data={"sub": user.id}, user=doc)
         user_response = UserResponse(id=user.id, name=user.name, email=user.email)
         
         return TokenResponse(access_token=access_token, token_type="bearer", user=user_response)
@@ -349,10 +2635,18 @@ async def signup(user_data: UserSignup):
 async def login(credentials: UserLogin):
     try:
         user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-        if not user or not verify_password(credentials.password, user["password_hash"]):
+        if not user:
             raise HTTPException(status_code=401, detail="Invalid email or password")
         
-        access_token = create_access_token(data={"sub": user["id"]})
+        valid, new_hash = await verify_password(credentials.password, user["password_hash"])
+        if not valid:
+            raise HTTPException(status_code=401, detail="Invalid email or password")
+        
+        if new_hash:
+            await db.users.update_one({"id": user["id"]}, {"$set": {"password_hash": new_hash}})
+            password_hash_stats["rehashed"] += 1
+        
+        access_token = create_access_token(data={"sub": user["id"]}, user=user)
         user_response = UserResponse(id=user["id"], name=user["name"], email=user["email"])
         
         return TokenResponse(access_token=access_token, token_type="bearer", user=user_response)
@@ -363,6 +2657,26 @@ async def login(credentials: UserLogin):
         logger.error(f"Error in login: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/auth/hash-stats")
+async def get_password_hash_stats():
+    completed = password_hash_stats["completed"]
+    return {
+        **password_hash_stats,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        "concurrency": PASSWORD_HASH_CONCURRENCY,
+        "average_seconds": round(password_hash_stats["total_seconds"] / completed, 4) if completed else 0.0
+    }
+
+@api_router.get("/auth/cache-stats")
+async def get_user_cache_stats():
+    lookups = user_cache_stats["claims_hits"] + user_cache_stats["cache_hits"] + user_cache_stats["misses"]
+    skipped = user_cache_stats["claims_hits"] + user_cache_stats["cache_hits"]
+    return {
+        **user_cache_stats,
+        "hit_rate": round(skipped / lookups, 4) if lookups else 0.0,
+        "entries": len(user_cache)
+    }
+
 @api_router.get("/auth/me", response_model=UserResponse)
 async def get_me(current_user: dict = Depends(get_current_user)):
     if not current_user:
@@ -387,6 +2701,14 @@ async def create_child_profile(profile_data: ChildProfileInput, current_user: di
         doc = child.model_dump()
         doc['created_at'] = doc['created_at'].isoformat()
         await db.children.insert_one(doc)
+        # A new child has no history, so its aggregate starts initialized and is never backfilled
+        await db.child_exposure.insert_one({
+            "child_id": child.id,
+            **empty_child_exposure(),
+            "initialized": True,
+            "tracking_since": doc['created_at'],
+            "updated_at": doc['created_at']
+        })
         
         return ChildProfileResponse(**doc)
         
@@ -400,8 +2722,8 @@ async def get_children(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     try:
-        children = await db.children.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(100)
-        return [ChildProfileResponse(**child) for child in children]
+        children = await db.children.find({"user_id": current_user["id"]}, child_serializer.projection).to_list(100)
+        return child_serializer.response(children)
         
     except Exception as e:
         logger.error(f"Error fetching children: {str(e)}")
@@ -413,10 +2735,10 @@ async def get_child(child_id: str, current_user: dict = Depends(get_current_user
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     try:
-        child = await db.children.find_one({"id": child_id, "user_id": current_user["id"]}, {"_id": 0})
+        child = await db.children.find_one({"id": child_id, "user_id": current_user["id"]}, child_serializer.projection)
         if not child:
             raise HTTPException(status_code=404, detail="Child profile not found")
-        return ChildProfileResponse(**child)
+        return child_serializer.response(child)
         
     except HTTPException:
         raise
@@ -472,75 +2794,303 @@ async def root():
     return {"message": "Revivedu API - Reviving Education Through Intelligence"}
 
 @api_router.post("/activities/generate", response_model=ActivityResponse)
-async def create_activity(input_data: ActivityInput):
+async def create_activity(input_data: ActivityInput, fresh: bool = False):
     try:
-        ai_response = await generate_activity_with_ai(input_data)
-        
-        activity = Activity(
-            child_id=input_data.child_id,
-            age=input_data.age,
-            subjects=input_data.subjects,
-            intelligences=input_data.intelligences,
-            tools=input_data.tools,
-            title=ai_response["title"],
-            objective=ai_response["objective"],
-            description=ai_response["description"],
-            expected_outcome=ai_response["expected_outcome"],
-            materials_required=ai_response["materials_required"],
-            curricular_areas=ai_response["curricular_areas"],
-            instructions=ai_response["instructions"],
-            success_metrics=ai_response["success_metrics"],
-            reflection_question=ai_response["reflection_question"],
-            learning_outcomes=ai_response.get("learning_outcomes", []),
-            skills=ai_response.get("skills", []),
-            estimated_time=ai_response.get("estimated_time"),
-            extensions=ai_response.get("extensions", []),
-            discussion_questions=ai_response.get("discussion_questions", []),
-            real_world_connection=ai_response.get("real_world_connection")
-        )
-        
-        doc = activity.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        await db.activities.insert_one(doc)
-        
+        doc = await generate_and_store_activity(input_data, fresh=fresh)
         return ActivityResponse(**doc)
         
     except Exception as e:
         logger.error(f"Error creating activity: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/activities", response_model=List[ActivityResponse])
-async def get_activities(
+@api_router.post("/activities/generate/retrieve", response_model=ActivityRetrieveResponse)
+async def retrieve_or_generate_activity(
+    input_data: ActivityInput,
+    k: int = Query(5, ge=1, le=50),
+    min_score: float = Query(SIMILARITY_THRESHOLD, ge=0, le=1),
+    generate: bool = True
+):
+    # Retrieve-before-generate: return close existing activities, and only pay for a
+    # generation when none of them clears min_score
+    try:
+        # A partly loaded index would miss existing matches and pay for a generation instead
+        if not similarity_index.ready:
+            raise HTTPException(status_code=503, detail="Activity index is still loading")
+        
+        ranked = [(activity_id, score) for activity_id, score in similarity_index.search(input_data, k) if score >= min_score]
+        
+        matches = []
+        if ranked:
+            scores = dict(ranked)
+            activities = await db.activities.find({"id": {"$in": list(scores)}}, ACTIVITY_SUMMARY_PROJECTION).to_list(len(scores))
+            matches = sorted(
+                (ActivityMatch(score=round(scores[activity["id"]], 4), activity=ActivitySummaryResponse(**activity)) for activity in activities),
+                key=lambda match: match.score,
+                reverse=True
+            )
+        
+        generated = None
+        if not matches and generate:
+            doc = await generate_and_store_activity(input_data)
+            generated = ActivityResponse(**doc)
+        
+        return ActivityRetrieveResponse(matches=matches, generated=generated, index_size=len(similarity_index))
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving similar activities: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/activities/generate/batch", response_model=ActivityBatchResponse)
+async def create_activity_batch(batch_input: ActivityBatchInput):
+    # Variations of one input bypass the cache after the first so each item is distinct
+    items = [(input_data, batch_input.fresh) for input_data in batch_input.inputs]
+    if batch_input.input:
+        items.extend(
+            (batch_input.input, batch_input.fresh or variation > 0)
+            for variation in range(batch_input.variations)
+        )
+    
+    if not items:
+        raise HTTPException(status_code=400, detail="Provide inputs or an input with variations")
+    if len(items) > BATCH_GENERATION_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch size cannot exceed {BATCH_GENERATION_MAX_ITEMS} activities")
+    
+    try:
+        semaphore = asyncio.Semaphore(BATCH_GENERATION_CONCURRENCY)
+        results = await asyncio.gather(*[
+            generate_batch_item(index, input_data, fresh, semaphore)
+            for index, (input_data, fresh) in enumerate(items)
+        ])
+        
+        generated = [result for result in results if "doc" in result]
+        if generated:
+            # Items are stamped at insert time rather than when each generation finished, so
+            # readers that follow created_at see them in the order they became visible
+            inserted_at = datetime.now(timezone.utc).isoformat()
+            for result in generated:
+                result["doc"]["created_at"] = inserted_at
+            await db.activities.insert_many([result["doc"] for result in generated])
+            await record_activity_exposure([result["doc"] for result in generated])
+            for result in generated:
+                result["doc"].pop('_id', None)
+                similarity_index.add(result["doc"])
+                if result["cache_key"]:
+                    await store_generation_cache(result["cache_key"], result["ai_response"])
+        
+        response_items = [
+            ActivityBatchItem(index=result["index"], activity=ActivityResponse(**result["doc"]))
+            if "doc" in result else
+            ActivityBatchItem(index=result["index"], error=result["error"])
+            for result in results
+        ]
+        
+        return ActivityBatchResponse(
+            total=len(results),
+            succeeded=len(generated),
+            failed=len(results) - len(generated),
+            items=response_items
+        )
+        
+    except Exception as e:
+        logger.error(f"Error creating activity batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/activities/generate/stream")
+async def stream_activity(input_data: ActivityInput, fresh: bool = False):
+    return StreamingResponse(
+        stream_generated_activity(input_data, fresh),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.post("/activities/generate/jobs", response_model=GenerationJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_generation_job(input_data: ActivityInput, fresh: bool = False):
+    try:
+        now = datetime.now(timezone.utc).isoformat()
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": "queued",
+            "stage": "queued",
+            "progress": 0,
+            "attempts": 0,
+            "input": input_data.model_dump(),
+            "fresh": fresh,
+            "activity_id": None,
+            "error": None,
+            "available_at": now,
+            "created_at": now,
+            "updated_at": now
+        }
+        await db.generation_jobs.insert_one(job)
+        job.pop('_id', None)
+        generation_job_wakeup.set()
+        return GenerationJobResponse(**job)
+        
+    except Exception as e:
+        logger.error(f"Error creating generation job: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/activities/generate/jobs/{job_id}", response_model=GenerationJobResponse)
+async def get_generation_job(job_id: str):
+    try:
+        job = await db.generation_jobs.find_one({"id": job_id}, {"_id": 0, "input": 0})
+        if not job:
+            raise HTTPException(status_code=404, detail="Generation job not found")
+        
+        if job["status"] == "completed" and job.get("activity_id"):
+            activity = await db.activities.find_one({"id": job["activity_id"]}, {"_id": 0})
+            if activity:
+                job["activity"] = ActivityResponse(**activity)
+        
+        return GenerationJobResponse(**job)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching generation job: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/activities/generate/quality-stats")
+async def get_generation_quality_stats():
+    responses = generation_quality_stats["responses"]
+    return {
+        **generation_quality_stats,
+        "failure_rate": round((generation_quality_stats["parse_failures"] + generation_quality_stats["repair_failures"]) / responses, 4) if responses else 0.0,
+        "repair_rate": round(generation_quality_stats["repairs"] / responses, 4) if responses else 0.0
+    }
+
+@api_router.get("/activities/generate/latency-stats")
+async def get_generation_latency_stats():
+    calls = llm_slo_stats["calls"]
+    return {
+        **llm_slo_stats,
+        "average_seconds": round(llm_slo_stats["total_seconds"] / calls, 3) if calls else 0.0,
+        "attempt_timeout_seconds": LLM_ATTEMPT_TIMEOUT_SECONDS,
+        "hedge_delay_seconds": LLM_HEDGE_DELAY_SECONDS,
+        "fallback_model": LLM_FALLBACK_MODEL or None
+    }
+
+@api_router.get("/activities/generate/pregeneration-stats")
+async def get_pregeneration_stats():
+    served = pregeneration_stats["stock_hits"] + pregeneration_stats["stock_misses"]
+    return {
+        **pregeneration_stats,
+        "stock_hit_rate": round(pregeneration_stats["stock_hits"] / served, 4) if served else 0.0,
+        "stocked": await db.generation_stock.count_documents({}),
+        "budget_tokens_left": max(pregeneration_budget_left(), 0),
+        "idle": is_generation_idle()
+    }
+
+@api_router.get("/activities/generate/cache-stats")
+async def get_generation_cache_stats():
+    lookups = generation_cache_stats["memory_hits"] + generation_cache_stats["mongo_hits"] + generation_cache_stats["misses"]
+    hits = generation_cache_stats["memory_hits"] + generation_cache_stats["mongo_hits"]
+    return {
+        **generation_cache_stats,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "memory_entries": len(generation_cache_memory)
+    }
+
+def build_activity_filter(
     subject: Optional[str] = None,
     intelligence: Optional[str] = None,
     age: Optional[int] = None,
     child_id: Optional[str] = None
+) -> dict:
+    query = {}
+    if subject:
+        query['subjects'] = subject
+    if intelligence:
+        query['intelligences'] = intelligence
+    if age:
+        query['age'] = age
+    if child_id:
+        query['child_id'] = child_id
+    return query
+
+@api_router.get("/activities/search", response_model=List[ActivitySearchResult])
+async def search_activities(
+    q: str = Query(..., min_length=1, max_length=200),
+    subject: Optional[str] = None,
+    intelligence: Optional[str] = None,
+    age: Optional[int] = None,
+    child_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    try:
+        query = build_activity_filter(subject, intelligence, age, child_id)
+        query["$text"] = {"$search": q}
+        
+        projection = {**ACTIVITY_SUMMARY_PROJECTION, "score": {"$meta": "textScore"}}
+        activities = await db.activities.find(query, projection).sort(
+            [("score", {"$meta": "textScore"}), ("created_at", -1)]
+        ).skip(offset).limit(limit).to_list(limit)
+        
+        return activity_search_serializer.response(activities)
+        
+    except Exception as e:
+        logger.error(f"Error searching activities: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/activities", response_model=Union[List[ActivityResponse], List[ActivitySummaryResponse]])
+async def get_activities(
+    request: Request,
+    subject: Optional[str] = None,
+    intelligence: Optional[str] = None,
+    age: Optional[int] = None,
+    child_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: str = Query("full", pattern="^(full|summary)$")
 ):
     try:
-        query = {}
-        if subject:
-            query['subjects'] = subject
-        if intelligence:
-            query['intelligences'] = intelligence
-        if age:
-            query['age'] = age
-        if child_id:
-            query['child_id'] = child_id
+        query = build_activity_filter(subject, intelligence, age, child_id)
+        if cursor:
+            query.update(keyset_filter(decode_cursor(cursor)))
+        
+        serializer = activity_summary_serializer if fields == "summary" else activity_serializer
         
-        activities = await db.activities.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
-        return [ActivityResponse(**activity) for activity in activities]
+        # Fetch one extra row to learn whether another page exists
+        activities = await db.activities.find(query, serializer.projection).sort(
+            [("created_at", -1), ("id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
         
+        extra_headers = {}
+        if len(activities) > limit:
+            activities = activities[:limit]
+            extra_headers["X-Next-Cursor"] = encode_cursor(activities[-1])
+        
+        # Activities are immutable, so a page is identified by the ids it contains
+        etag = make_etag(fields, extra_headers.get("X-Next-Cursor", ""), *(activity["id"] for activity in activities))
+        last_modified = latest_timestamp(activities)
+        headers = cache_headers(etag, last_modified, ACTIVITY_LIST_CACHE_CONTROL, extra_headers)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(headers)
+        
+        return serializer.response(activities, headers=headers)
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching activities: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/activities/{activity_id}", response_model=ActivityResponse)
-async def get_activity(activity_id: str):
+async def get_activity(activity_id: str, request: Request):
     try:
-        activity = await db.activities.find_one({"id": activity_id}, {"_id": 0})
+        activity = await db.activities.find_one({"id": activity_id}, activity_serializer.projection)
         if not activity:
             raise HTTPException(status_code=404, detail="Activity not found")
-        return ActivityResponse(**activity)
+        
+        last_modified = parse_stored_datetime(activity.get("created_at"))
+        etag = make_etag(activity["id"], activity.get("created_at"))
+        headers = cache_headers(etag, last_modified, ACTIVITY_CACHE_CONTROL)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(headers)
+        return activity_serializer.response(activity, headers=headers)
         
     except HTTPException:
         raise
@@ -555,6 +3105,7 @@ async def submit_feedback(feedback_input: FeedbackInput):
         doc = feedback.model_dump()
         doc['created_at'] = doc['created_at'].isoformat()
         await db.feedbacks.insert_one(doc)
+        await record_feedback_exposure(doc)
         return {"message": "Feedback submitted successfully", "id": feedback.id}
         
     except Exception as e:
@@ -562,10 +3113,17 @@ async def submit_feedback(feedback_input: FeedbackInput):
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/feedback/{activity_id}")
-async def get_feedback(activity_id: str):
+async def get_feedback(activity_id: str, request: Request):
     try:
         feedbacks = await db.feedbacks.find({"activity_id": activity_id}, {"_id": 0}).to_list(100)
-        return feedbacks
+        
+        # Feedback is append-only, so the set of ids identifies the list
+        etag = make_etag(activity_id, *(feedback.get("id") for feedback in feedbacks))
+        last_modified = latest_timestamp(feedbacks)
+        headers = cache_headers(etag, last_modified, FEEDBACK_CACHE_CONTROL)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(headers)
+        return ORJSONResponse(feedbacks, headers=headers)
         
     except Exception as e:
         logger.error(f"Error fetching feedback: {str(e)}")
@@ -573,101 +3131,149 @@ async def get_feedback(activity_id: str):
 
 @api_router.post("/artifacts")
 async def upload_artifact(
+    background_tasks: BackgroundTasks,
     activity_id: str = Form(...),
     child_id: Optional[str] = Form(None),
     file: UploadFile = File(...)
 ):
     try:
-        content = await file.read()
-        file_data = base64.b64encode(content).decode('utf-8')
+        content_type = file.content_type or "application/octet-stream"
+        blob = await store_artifact_blob(file, {"content_type": content_type})
+        artifact_upload_bytes.observe(blob["size"])
+        is_image = content_type.startswith("image/")
         
         artifact = Artifact(
             activity_id=activity_id,
             child_id=child_id,
             filename=file.filename,
-            content_type=file.content_type,
-            file_data=file_data
+            content_type=content_type,
+            derivatives_status="pending" if is_image else None,
+            **blob
         )
         
         doc = artifact.model_dump()
         doc['created_at'] = doc['created_at'].isoformat()
         await db.artifacts.insert_one(doc)
         
-        return {"message": "Artifact uploaded successfully", "id": artifact.id}
+        if is_image:
+            background_tasks.add_task(generate_artifact_derivatives, artifact.id)
         
+        return {"message": "Artifact uploaded successfully", "id": artifact.id, "size": artifact.size}
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading artifact: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/activities/{activity_id}/audio")
-async def generate_activity_audio(activity_id: str):
+@api_router.get("/artifacts/{artifact_id}/content")
+async def download_artifact(artifact_id: str, request: Request, variant: Optional[str] = None):
     try:
-        activity = await db.activities.find_one({"id": activity_id}, {"_id": 0})
-        if not activity:
-            raise HTTPException(status_code=404, detail="Activity not found")
-        
-        # Create concise summary for audio
-        summary_text = f"Activity: {activity['title']}. "
+        artifact = await db.artifacts.find_one({"id": artifact_id}, {"_id": 0})
+        if not artifact:
+            raise HTTPException(status_code=404, detail="Artifact not found")
         
-        if activity.get('objective'):
-            summary_text += f"Objective: {activity['objective']}. "
+        headers = artifact_content_headers(artifact["content_type"], artifact.get("filename"))
         
-        summary_text += f"Description: {activity['description']}. "
+        # Derivatives that are not ready yet fall back to the original
+        derivative = (artifact.get("derivatives") or {}).get(variant) if variant else None
+        if derivative:
+            try:
+                grid_out = await artifact_bucket.open_download_stream(ObjectId(derivative["blob_id"]))
+                return build_range_response(
+                    request, grid_out.length, f"{artifact['sha256']}-{variant}", derivative["content_type"],
+                    lambda start, end: iter_grid_out_range(grid_out, start, end),
+                    artifact_content_headers(derivative["content_type"], artifact.get("filename"))
+                )
+            except NoFile:
+                logger.error(f"Missing {variant} derivative for artifact {artifact_id}")
         
-        if activity.get('estimated_time'):
-            summary_text += f"Estimated time: {activity['estimated_time']}. "
+        # Artifacts uploaded before blob storage still carry their bytes inline
+        if artifact.get("file_data"):
+            content = base64.b64decode(artifact["file_data"])
+            return build_range_response(
+                request, len(content), hashlib.sha256(content).hexdigest(), artifact["content_type"],
+                lambda start, end: iter_bytes_range(content, start, end),
+                headers
+            )
         
-        # Add materials
-        if activity.get('materials_required') and len(activity['materials_required']) > 0:
-            materials = ", ".join(activity['materials_required'][:5])
-            summary_text += f"Materials needed: {materials}. "
+        try:
+            grid_out = await artifact_bucket.open_download_stream(ObjectId(artifact["blob_id"]))
+        except NoFile:
+            raise HTTPException(status_code=404, detail="Artifact content not found")
         
-        # Add brief instructions overview
-        if len(activity['instructions']) > 0:
-            summary_text += f"This activity has {len(activity['instructions'])} steps. "
-            if len(activity['instructions']) <= 3:
-                summary_text += "Steps: " + ". ".join(activity['instructions'][:3]) + ". "
-            else:
-                summary_text += f"Key steps include: {activity['instructions'][0]}, and {activity['instructions'][1]}. "
-        
-        # Add expected outcome
-        if activity.get('expected_outcome'):
-            summary_text += f"Expected outcome: {activity['expected_outcome']}. "
-        
-        # Limit to 4096 characters for TTS API
-        if len(summary_text) > 4000:
-            summary_text = summary_text[:3997] + "..."
+        return build_range_response(
+            request, grid_out.length, artifact["sha256"], artifact["content_type"],
+            lambda start, end: iter_grid_out_range(grid_out, start, end),
+            headers
+        )
         
-        # Generate audio using OpenAI TTS
-        emergent_key = os.environ.get('EMERGENT_LLM_KEY')
-        tts = OpenAITextToSpeech(api_key=emergent_key)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error downloading artifact: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/activities/{activity_id}/audio")
+async def generate_activity_audio(activity_id: str, request: Request, response_format: str = Query("mpeg", alias="format")):
+    try:
+        activity = await db.activities.find_one({"id": activity_id}, {"_id": 0})
+        if not activity:
+            raise HTTPException(status_code=404, detail="Activity not found")
         
-        audio_bytes = await tts.generate_speech(
-            text=summary_text,
-            model="tts-1",
-            voice="nova",  # Clear, energetic voice suitable for educational content
-            speed=1.0
-        )
+        summary_text = build_audio_summary(activity)
         
-        # Return audio as base64 for easy frontend consumption
-        import base64
-        audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+        if response_format == "json":
+            audio_bytes, cached = await get_activity_audio_bytes(summary_text)
+            
+            # Return audio as base64 for clients that still expect the JSON shape
+            audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+            
+            return {
+                "audio_base64": audio_base64,
+                "text": summary_text,
+                "format": "mp3",
+                "cached": cached
+            }
         
-        return {
-            "audio_base64": audio_base64,
-            "text": summary_text,
-            "format": "mp3"
-        }
+        cache_key = audio_cache_key(summary_text, TTS_MODEL, TTS_VOICE, TTS_SPEED)
+        headers = {"Cache-Control": "no-cache"}
+        try:
+            grid_out = await audio_bucket.open_download_stream_by_name(cache_key)
+            return build_range_response(
+                request, grid_out.length, cache_key, "audio/mpeg",
+                lambda start, end: iter_grid_out_range(grid_out, start, end),
+                headers
+            )
+        except NoFile:
+            audio_bytes, _ = await get_activity_audio_bytes(summary_text)
+            return build_range_response(
+                request, len(audio_bytes), cache_key, "audio/mpeg",
+                lambda start, end: iter_bytes_range(audio_bytes, start, end),
+                headers
+            )
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error generating audio: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate audio: {str(e)}")
-async def get_artifacts(activity_id: str):
+
+@api_router.get("/artifacts/{activity_id}", response_model=List[ArtifactResponse])
+async def get_artifacts(
+    activity_id: str,
+    limit: int = Query(50, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
     try:
-        artifacts = await db.artifacts.find({"activity_id": activity_id}, {"_id": 0}).to_list(100)
-        return [ArtifactResponse(**artifact) for artifact in artifacts]
+        artifacts = await db.artifacts.find(
+            {"activity_id": activity_id},
+            {
+                "_id": 0, "id": 1, "activity_id": 1, "child_id": 1, "filename": 1, "content_type": 1,
+                "size": 1, "derivatives": 1, "derivatives_status": 1, "created_at": 1
+            }
+        ).sort("created_at", 1).skip(offset).limit(limit).to_list(limit)
+        return [artifact_response(artifact) for artifact in artifacts]
         
     except Exception as e:
         logger.error(f"Error fetching artifacts: {str(e)}")
@@ -675,7 +3281,7 @@ async def get_artifacts(activity_id: str):
 
 # ============ Exposure Report Route ============
 @api_router.get("/children/{child_id}/exposure-report", response_model=ExposureReport)
-async def get_exposure_report(child_id: str, current_user: dict = Depends(get_current_user)):
+async def get_exposure_report(child_id: str, request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -684,26 +3290,25 @@ async def get_exposure_report(child_id: str, current_user: dict = Depends(get_cu
         if not child:
             raise HTTPException(status_code=404, detail="Child profile not found")
         
-        activities = await db.activities.find({"child_id": child_id}, {"_id": 0}).to_list(1000)
-        feedbacks = await db.feedbacks.find({"child_id": child_id}, {"_id": 0}).to_list(1000)
-        
-        intelligence_counts = {}
-        subject_counts = {}
-        all_skills = []
-        total_rating = 0
+        exposure = await db.child_exposure.find_one({"child_id": child_id}, {"_id": 0})
+        if not exposure or not exposure.get("initialized"):
+            # Children with history from before the aggregate existed are backfilled on first read;
+            # incremental updates alone never mark a document as initialized
+            exposure = await backfill_child_exposure(child_id)
         
-        for activity in activities:
-            for intel in activity.get("intelligences", []):
-                intelligence_counts[intel] = intelligence_counts.get(intel, 0) + 1
-            for subject in activity.get("subjects", []):
-                subject_counts[subject] = subject_counts.get(subject, 0) + 1
-            all_skills.extend(activity.get("skills", []))
+        # Every exposure write bumps updated_at; the child's name is the only other input. Renames
+        # leave no timestamp, so the report is validated by ETag alone and sends no Last-Modified
+        etag = make_etag(child_id, child["name"], exposure.get("updated_at"))
+        headers = cache_headers(etag, None, EXPOSURE_REPORT_CACHE_CONTROL, {"Vary": "Authorization"})
+        if is_not_modified(request, etag, None):
+            return not_modified_response(headers)
+        response.headers.update(headers)
         
-        for feedback in feedbacks:
-            total_rating += feedback.get("rating", 0)
-        
-        avg_rating = total_rating / len(feedbacks) if feedbacks else 0
-        unique_skills = list(set(all_skills))
+        intelligence_counts = decode_exposure_counts(exposure.get("intelligence_counts"))
+        subject_counts = decode_exposure_counts(exposure.get("subject_counts"))
+        rating_count = exposure.get("rating_count", 0)
+        avg_rating = exposure.get("rating_total", 0) / rating_count if rating_count else 0
+        unique_skills = exposure.get("skills", [])
         
         sorted_intelligences = sorted(intelligence_counts.items(), key=lambda x: x[1], reverse=True)
         strengths = [intel for intel, _ in sorted_intelligences[:3]] if sorted_intelligences else []
@@ -719,7 +3324,7 @@ async def get_exposure_report(child_id: str, current_user: dict = Depends(get_cu
         return ExposureReport(
             child_id=child_id,
             child_name=child["name"],
-            total_activities=len(activities),
+            total_activities=exposure.get("total_activities", 0),
             intelligence_exposure=intelligence_counts,
             subject_exposure=subject_counts,
             skills_developed=unique_skills,
@@ -735,17 +3340,358 @@ async def get_exposure_report(child_id: str, current_user: dict = Depends(get_cu
         logger.error(f"Error generating exposure report: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/children/{child_id}/recommendations", response_model=ChildRecommendations)
+async def get_child_recommendations(
+    child_id: str,
+    limit: int = Query(10, ge=1, le=50),
+    current_user: dict = Depends(get_current_user)
+):
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    try:
+        child = await db.children.find_one({"id": child_id, "user_id": current_user["id"]}, {"_id": 0})
+        if not child:
+            raise HTTPException(status_code=404, detail="Child profile not found")
+        if not similarity_index.ready:
+            raise HTTPException(status_code=503, detail="Activity index is still loading")
+        
+        exposure, done, feedbacks = await asyncio.gather(
+            db.child_exposure.find_one({"child_id": child_id}, {"_id": 0}),
+            db.activities.find({"child_id": child_id}, {"_id": 0, "id": 1}).to_list(None),
+            db.feedbacks.find({"child_id": child_id}, {"_id": 0, "activity_id": 1, "rating": 1}).to_list(None)
+        )
+        if not exposure or not exposure.get("initialized"):
+            exposure = await backfill_child_exposure(child_id)
+        
+        rows = similarity_index.rows
+        rated_rows = [(rows[feedback["activity_id"]], feedback.get("rating", 0)) for feedback in feedbacks if feedback.get("activity_id") in rows]
+        seen_rows = sorted({rows[activity["id"]] for activity in done if activity["id"] in rows} | {row for row, _ in rated_rows})
+        
+        ranked = score_recommendations(child, exposure, rated_rows, seen_rows, limit)
+        ids = [similarity_index.ids[row] for row, _, _ in ranked]
+        activities = {
+            activity["id"]: activity
+            for activity in await db.activities.find({"id": {"$in": ids}}, {"_id": 0}).to_list(len(ids))
+        }
+        
+        recommendations = [
+            RecommendedActivity(score=round(score, 4), components=components, activity=ActivityResponse(**activities[similarity_index.ids[row]]))
+            for row, score, components in ranked
+            if similarity_index.ids[row] in activities
+        ]
+        return ChildRecommendations(
+            child_id=child_id,
+            candidates=len(similarity_index) - len(seen_rows),
+            recommendations=recommendations,
+            generated_at=datetime.now(timezone.utc).isoformat()
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating recommendations: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/children/{child_id}/exposure-trends", response_model=ExposureTrends)
+async def get_exposure_trends(
+    child_id: str,
+    interval: str = Query("week", pattern="^(day|week|month)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    rolling_window: int = Query(4, ge=1, le=52),
+    current_user: dict = Depends(get_current_user)
+):
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    try:
+        child = await db.children.find_one({"id": child_id, "user_id": current_user["id"]}, {"_id": 0, "id": 1})
+        if not child:
+            raise HTTPException(status_code=404, detail="Child profile not found")
+        
+        # Naive datetimes from the query string are treated as UTC
+        start = start.replace(tzinfo=timezone.utc) if start and start.tzinfo is None else start
+        end = end.replace(tzinfo=timezone.utc) if end and end.tzinfo is None else end
+        
+        activity_trends, rating_trends = await asyncio.gather(
+            aggregate_activity_trends(child_id, interval, start, end),
+            aggregate_rating_trends(child_id, interval, start, end, rolling_window)
+        )
+        
+        buckets = {}
+        
+        def bucket_for(bucket_start: datetime) -> dict:
+            return buckets.setdefault(bucket_start, {
+                "bucket_start": bucket_start.replace(tzinfo=timezone.utc).isoformat(),
+                "activities": 0,
+                "intelligence_exposure": {},
+                "subject_exposure": {},
+                "ratings": 0
+            })
+        
+        for row in activity_trends["totals"]:
+            bucket_for(row["_id"])["activities"] = row["count"]
+        for row in activity_trends["intelligences"]:
+            bucket_for(row["_id"]["bucket"])["intelligence_exposure"][row["_id"]["name"]] = row["count"]
+        for row in activity_trends["subjects"]:
+            bucket_for(row["_id"]["bucket"])["subject_exposure"][row["_id"]["name"]] = row["count"]
+        for row in rating_trends:
+            bucket = bucket_for(row["_id"])
+            bucket["ratings"] = row["ratings"]
+            bucket["average_rating"] = round(row["rating_total"] / row["ratings"], 2) if row["ratings"] else None
+            bucket["rolling_average_rating"] = round(row["rolling_total"] / row["rolling_count"], 2) if row["rolling_count"] else None
+        
+        return ExposureTrends(
+            child_id=child_id,
+            interval=interval,
+            start=start.isoformat() if start else None,
+            end=end.isoformat() if end else None,
+            buckets=[ExposureTrendBucket(**buckets[key]) for key in sorted(buckets)],
+            generated_at=datetime.now(timezone.utc).isoformat()
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating exposure trends: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ============ Metrics Route ============
+# The existing *_stats counters are exported as-is, so /metrics is the one place to scrape
+STATS_EXPORTS = [
+    ("revivedu_password_hash", "bcrypt hashing pool", password_hash_stats, {"queued", "running"}),
+    ("revivedu_user_cache", "Authenticated user resolution", user_cache_stats, set()),
+    ("revivedu_llm_slo", "LLM deadline, hedging and fallback", llm_slo_stats, set()),
+    ("revivedu_generation_quality", "LLM output parsing and repair", generation_quality_stats, set()),
+    ("revivedu_generation_cache", "Generation cache", generation_cache_stats, set()),
+    ("revivedu_pregeneration", "Idle-time pre-generation", pregeneration_stats, set())
+]
+
+STATE_GAUGES = [
+    ("revivedu_user_cache_entries", "Cached authenticated users", lambda: len(user_cache)),
+    ("revivedu_generation_cache_memory_entries", "In-memory generation cache entries", lambda: len(generation_cache_memory)),
+    ("revivedu_similarity_index_activities", "Activities in the similarity index", lambda: len(similarity_index)),
+    ("revivedu_tts_inflight_syntheses", "Distinct text-to-speech syntheses in progress", lambda: len(audio_generation_inflight)),
+    ("revivedu_background_writes", "Fire-and-forget writes still pending", lambda: len(background_writes))
+]
+
+def render_metrics() -> str:
+    lines = []
+    for metric in metric_families:
+        lines.extend(metric.render())
+    
+    for prefix, help_text, stats, gauges in STATS_EXPORTS:
+        events = [(key, value) for key, value in stats.items() if key not in gauges and key != "total_seconds"]
+        lines.extend([f"# HELP {prefix}_events_total {help_text} events", f"# TYPE {prefix}_events_total counter"])
+        lines.extend(f'{prefix}_events_total{{event="{key}"}} {value}' for key, value in events)
+        if "total_seconds" in stats:
+            lines.extend([f"# HELP {prefix}_seconds_total {help_text} time spent", f"# TYPE {prefix}_seconds_total counter", f"{prefix}_seconds_total {stats['total_seconds']}"])
+        for key in sorted(gauges):
+            lines.extend([f"# HELP {prefix}_{key} {help_text} {key}", f"# TYPE {prefix}_{key} gauge", f"{prefix}_{key} {stats[key]}"])
+    
+    for name, help_text, read in STATE_GAUGES:
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {read()}"])
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(ArtifactUploadLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],
 )
 
+@app.on_event("startup")
+async def ensure_database_indexes():
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def start_generation_workers():
+    try:
+        # Only jobs whose lease lapsed are requeued; a live peer may still be running the rest
+        requeued = await requeue_expired_generation_jobs()
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted generation jobs")
+    except Exception as e:
+        logger.error(f"Error preparing generation jobs: {str(e)}")
+    
+    for worker_index in range(GENERATION_WORKER_CONCURRENCY):
+        generation_workers.append(asyncio.create_task(generation_worker(worker_index)))
+
+@app.on_event("startup")
+async def start_similarity_index():
+    global similarity_worker
+    similarity_worker = asyncio.create_task(run_similarity_index())
+
+@app.on_event("shutdown")
+async def stop_similarity_index():
+    if similarity_worker is not None:
+        similarity_worker.cancel()
+        await asyncio.gather(similarity_worker, return_exceptions=True)
+
+@app.on_event("startup")
+async def start_pregeneration():
+    global pregeneration_worker
+    if PREGENERATION_ENABLED:
+        pregeneration_worker = asyncio.create_task(run_pregeneration())
+
+@app.on_event("shutdown")
+async def stop_pregeneration():
+    if pregeneration_worker is not None:
+        pregeneration_worker.cancel()
+        await asyncio.gather(pregeneration_worker, return_exceptions=True)
+
+@app.on_event("shutdown")
+async def stop_generation_workers():
+    for worker in generation_workers:
+        worker.cancel()
+    await asyncio.gather(*generation_workers, return_exceptions=True)
+    generation_workers.clear()
+
+@app.on_event("shutdown")
+async def shutdown_image_process_pool():
+    if image_process_pool is not None:
+        image_process_pool.shutdown(wait=False, cancel_futures=True)
+
+@app.on_event("shutdown")
+async def shutdown_password_hash_executor():
+    password_hash_executor.shutdown(wait=False, cancel_futures=True)
+
+@app.on_event("shutdown")
+async def shutdown_ai_provider():
+    if ai_provider is not None:
+        await ai_provider.close()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+# ============ Serialization Benchmark ============
+def sample_activity_document(index: int) -> dict:
+    activity = Activity(
+        child_id=str(uuid.uuid4()),
+        age=4 + index % 10,
+        subjects=["Science", "Mathematics"],
+        intelligences=["Logical-Mathematical", "Naturalistic", "Bodily-Kinesthetic"],
+        tools=["Paper", "Magnifying glass"],
+        title=f"Backyard Explorers {index}",
+        objective="Observe, classify and count living things found in a small patch of ground.",
+        description="Children mark out a square of ground, record every plant and insect they find and sort them into groups. " * 3,
+        expected_outcome="A labelled tally chart of the living things found.",
+        materials_required=["String", "Four sticks", "Magnifying glass", "Paper", "Pencil"],
+        curricular_areas={"Science": "Classification of living things", "Mathematics": "Tally charts and counting"},
+        instructions=[f"Step {step}: follow the observation routine carefully and record what you see." for step in range(1, 9)],
+        success_metrics=["Finds at least five living things", "Sorts them into two or more groups"],
+        reflection_question="Which group had the most members, and why do you think that is?",
+        learning_outcomes=["Classifies organisms by observable features", "Builds a tally chart"],
+        skills=["Observation", "Classification", "Counting"],
+        estimated_time="45 minutes",
+        extensions=["Repeat at a different time of day", "Compare two different patches"],
+        discussion_questions=["What surprised you?", "Where might the insects go at night?"],
+        real_world_connection="Ecologists survey plots in exactly this way to track biodiversity."
+    )
+    doc = activity.model_dump()
+    doc['created_at'] = doc['created_at'].isoformat()
+    return doc
+
+async def time_serialization(render, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await render()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+async def benchmark_serialization(rows: int, repeat: int) -> List[dict]:
+    activities = [sample_activity_document(index) for index in range(rows)]
+    children = [
+        {**ChildProfile(user_id="benchmark", name=f"Child {index}", age=6, interests=["space", "drawing"]).model_dump(), "created_at": datetime.now(timezone.utc).isoformat()}
+        for index in range(min(rows, 100))
+    ]
+    cases = [
+        ("GET /activities", ActivityResponse, List[ActivityResponse], activity_serializer, activities),
+        ("GET /activities?fields=summary", ActivitySummaryResponse, List[ActivitySummaryResponse], activity_summary_serializer, activities),
+        ("GET /activities/{id}", ActivityResponse, ActivityResponse, activity_serializer, activities[0]),
+        ("GET /children", ChildProfileResponse, List[ChildProfileResponse], child_serializer, children)
+    ]
+    
+    report = []
+    for name, model, response_type, serializer, content in cases:
+        field = create_response_field(name="benchmark_response", type_=response_type)
+        if isinstance(content, list):
+            projected = [{key: doc[key] for key in serializer.projection if key in doc} for doc in content]
+        else:
+            projected = {key: content[key] for key in serializer.projection if key in content}
+        
+        # Previous path: build models, let FastAPI validate and dump them against response_model,
+        # then encode with the stdlib JSON encoder
+        async def render_models():
+            models = [model(**doc) for doc in projected] if isinstance(projected, list) else model(**projected)
+            body = await serialize_response(field=field, response_content=models, is_coroutine=True)
+            return JSONResponse(body).body
+        
+        async def render_documents():
+            return serializer.response(projected).body
+        
+        before_ms = await time_serialization(render_models, repeat)
+        after_ms = await time_serialization(render_documents, repeat)
+        report.append({"endpoint": name, "before_ms": round(before_ms, 3), "after_ms": round(after_ms, 3), "speedup": round(before_ms / after_ms, 1) if after_ms else None})
+    return report
+
+# ============ Maintenance Commands ============
+async def run_maintenance_command(args: argparse.Namespace) -> int:
+    if args.command == "ensure-indexes":
+        await ensure_indexes()
+        print(f"Ensured {len(INDEX_SPECS)} indexes")
+        return 0
+    
+    if args.command == "rebuild-exposure":
+        child_ids = [args.child_id] if args.child_id else await db.children.distinct("id")
+        for child_id in child_ids:
+            exposure = await rebuild_child_exposure(child_id)
+            print(f"Rebuilt exposure for {child_id}: {exposure['total_activities']} activities, {exposure['rating_count']} ratings")
+        return 0
+    
+    if args.command == "explain-queries":
+        report = await explain_query_shapes(args.slow_ms)
+        flagged = [entry for entry in report if entry["problems"]]
+        for entry in report:
+            marker = ",".join(entry["problems"]) or "ok"
+            print(
+                f"[{marker}] {entry['collection']} filter={json.dumps(entry['filter'])} sort={entry['sort']} "
+                f"stages={'>'.join(entry['stages'])} keys={entry['keys_examined']} "
+                f"docs={entry['docs_examined']} returned={entry['returned']} time={entry['time_ms']}ms"
+            )
+        print(f"{len(flagged)} of {len(report)} query shapes need attention")
+        return 1 if flagged else 0
+    
+    if args.command == "benchmark-serialization":
+        for entry in await benchmark_serialization(args.rows, args.repeat):
+            print(f"{entry['endpoint']}: before={entry['before_ms']}ms after={entry['after_ms']}ms speedup={entry['speedup']}x")
+        return 0
+    
+    return 2
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Revivedu backend maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("ensure-indexes", help="Create all declared MongoDB indexes")
+    explain_parser = subparsers.add_parser("explain-queries", help="Report unindexed or slow query shapes")
+    explain_parser.add_argument("--slow-ms", type=int, default=50)
+    rebuild_parser = subparsers.add_parser("rebuild-exposure", help="Recompute child_exposure aggregates from activities and feedback")
+    rebuild_parser.add_argument("--child-id")
+    benchmark_parser = subparsers.add_parser("benchmark-serialization", help="Compare per-endpoint response serialization cost")
+    benchmark_parser.add_argument("--rows", type=int, default=100)
+    benchmark_parser.add_argument("--repeat", type=int, default=200)
+    
+    exit_code = asyncio.run(run_maintenance_command(parser.parse_args()))
+    client.close()
+    sys.exit(exit_code)
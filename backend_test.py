@@ -12,6 +12,8 @@ class HomeschoolPortalTester:
         self.tests_run = 0
         self.tests_passed = 0
         self.activity_id = None
+        self.artifact_id = None
+        self.artifact_content = None
         self.test_results = []
 
     def log_test(self, name, success, details=""):
@@ -209,6 +211,8 @@ class HomeschoolPortalTester:
             
             if success:
                 result = response.json()
+                self.artifact_id = result.get('id')
+                self.artifact_content = test_content
                 details = f"Artifact uploaded with ID: {result.get('id', 'Unknown')}"
             else:
                 details = f"Status: {response.status_code}, Response: {response.text[:200]}"
@@ -233,13 +237,23 @@ class HomeschoolPortalTester:
                 data = response.json()
                 details = f"Found {len(data)} artifacts"
                 if len(data) > 0:
-                    # Check if artifact has required fields
-                    artifact = data[0]
-                    required_fields = ['id', 'filename', 'content_type', 'file_data']
+                    # Check if artifact has required fields; file bytes are served from content_url
+                    artifact = next((item for item in data if item.get('id') == self.artifact_id), data[0])
+                    required_fields = ['id', 'filename', 'content_type', 'size', 'content_url']
                     missing_fields = [field for field in required_fields if not artifact.get(field)]
+                    # thumbnail_url is null for non-image uploads but must be present
+                    if 'thumbnail_url' not in artifact:
+                        missing_fields.append('thumbnail_url')
                     if missing_fields:
                         success = False
                         details += f", but missing fields: {missing_fields}"
+                    elif artifact.get('id') == self.artifact_id and self.artifact_content is not None:
+                        content_response = requests.get(f"{self.base_url}{artifact['content_url']}", timeout=10)
+                        if content_response.status_code != 200 or content_response.content != self.artifact_content:
+                            success = False
+                            details += f", but content_url returned status {content_response.status_code} with different bytes"
+                        else:
+                            details += ", content_url returned the uploaded bytes"
             else:
                 details = f"Status: {response.status_code}"
                 
@@ -67,20 +67,25 @@ const ActivityDetail = () => {
     }
   };
 
-  const generateAudio = async () => {
+  const generateAudio = () => {
+    // The audio element streams the MP3 directly, so playback starts before the download finishes
     setLoadingAudio(true);
-    try {
-      const response = await axios.get(`${API}/activities/${id}/audio`);
-      setAudioData(response.data);
-      toast.success("Audio summary generated!");
-    } catch (error) {
-      console.error("Error generating audio:", error);
-      toast.error("Failed to generate audio summary");
-    } finally {
+    setAudioData({ url: `${API}/activities/${id}/audio` });
+  };
+
+  const handleAudioReady = () => {
+    if (loadingAudio) {
       setLoadingAudio(false);
+      toast.success("Audio summary generated!");
     }
   };
 
+  const handleAudioError = () => {
+    setLoadingAudio(false);
+    setAudioData(null);
+    toast.error("Failed to generate audio summary");
+  };
+
   const handlePlayPause = () => {
     const audio = audioRef.current;
     if (!audio) return;
@@ -246,7 +251,10 @@ const ActivityDetail = () => {
                     <p className="text-sm text-foreground/60 mb-2">Activity Audio Summary</p>
                     <audio
                       ref={audioRef}
-                      src={`data:audio/mp3;base64,${audioData.audio_base64}`}
+                      src={audioData.url}
+                      preload="auto"
+                      onCanPlay={handleAudioReady}
+                      onError={handleAudioError}
                       onEnded={() => setIsPlaying(false)}
                       onPlay={() => setIsPlaying(true)}
                       onPause={() => setIsPlaying(false)}
@@ -673,8 +681,9 @@ const ActivityDetail = () => {
                         >
                           {artifact.content_type.startsWith('image/') ? (
                             <img
-                              src={`data:${artifact.content_type};base64,${artifact.file_data}`}
+                              src={`${BACKEND_URL}${artifact.thumbnail_url || artifact.content_url}`}
                               alt={artifact.filename}
+                              loading="lazy"
                               className="w-full h-48 object-cover rounded-xl mb-2"
                             />
                           ) : (
@@ -49,16 +49,15 @@ const ActivityLibrary = () => {
   const fetchActivities = async () => {
     try {
       let url = `${API}/activities`;
-      const params = new URLSearchParams();
+      // Cards only need summary fields, which keeps the list payload small
+      const params = new URLSearchParams({ fields: "summary" });
       
       const childId = searchParams.get("childId");
       if (childId) {
         params.append("child_id", childId);
       }
       
-      if (params.toString()) {
-        url += `?${params.toString()}`;
-      }
+      url += `?${params.toString()}`;
       
       const response = await axios.get(url);
       setActivities(response.data);
@@ -0,0 +1,27 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from server import ARTIFACT_FORM_OVERHEAD_BYTES, ARTIFACT_MAX_BYTES, app, artifact_content_headers
+
+@pytest.mark.parametrize("content_type", ["image/png", "image/jpeg", "IMAGE/WEBP; charset=binary"])
+def test_raster_images_are_inline(content_type):
+    headers = artifact_content_headers(content_type, "drawing.png")
+    assert headers["Content-Disposition"].startswith("inline;")
+    assert headers["X-Content-Type-Options"] == "nosniff"
+
+@pytest.mark.parametrize("content_type", ["text/html", "image/svg+xml", "application/pdf", "application/octet-stream"])
+def test_other_content_is_an_attachment(content_type):
+    headers = artifact_content_headers(content_type, "page.html")
+    assert headers["Content-Disposition"].startswith("attachment;")
+    assert headers["X-Content-Type-Options"] == "nosniff"
+    assert "sandbox" in headers["Content-Security-Policy"]
+
+def test_oversized_upload_is_refused_before_the_body_is_read():
+    declared = ARTIFACT_MAX_BYTES + ARTIFACT_FORM_OVERHEAD_BYTES + 1
+    # Without the context manager the startup handlers, and their database calls, never run
+    response = TestClient(app).post(
+        "/api/artifacts",
+        content=b"",
+        headers={"Content-Length": str(declared), "Content-Type": "multipart/form-data; boundary=x"}
+    )
+    assert response.status_code == 413
@@ -0,0 +1,19 @@
+import pytest
+from pydantic import ValidationError
+
+from server import BATCH_GENERATION_MAX_ITEMS, ActivityBatchInput
+
+INPUT = {"age": 7, "subjects": ["Science"], "intelligences": ["Naturalistic"], "tools": ["Paper"]}
+
+@pytest.mark.parametrize("variations", [0, -1, BATCH_GENERATION_MAX_ITEMS + 1, 1_000_000_000])
+def test_variations_out_of_bounds_are_rejected(variations):
+    with pytest.raises(ValidationError):
+        ActivityBatchInput(input=INPUT, variations=variations)
+
+def test_too_many_inputs_are_rejected():
+    with pytest.raises(ValidationError):
+        ActivityBatchInput(inputs=[INPUT] * (BATCH_GENERATION_MAX_ITEMS + 1))
+
+def test_batch_within_bounds_is_accepted():
+    batch = ActivityBatchInput(inputs=[INPUT], input=INPUT, variations=BATCH_GENERATION_MAX_ITEMS)
+    assert batch.variations == BATCH_GENERATION_MAX_ITEMS
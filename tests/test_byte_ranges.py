@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from server import build_range_response, iter_bytes_range, parse_byte_range
+
+DATA = bytes(range(100))
+
+def make_request(**headers) -> Request:
+    raw_headers = [(name.replace("_", "-").encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw_headers})
+
+def read_body(response) -> bytes:
+    async def collect():
+        return b"".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(collect())
+
+def range_response(data: bytes, **headers):
+    return build_range_response(
+        make_request(**headers), len(data), "etag", "application/octet-stream",
+        lambda start, end: iter_bytes_range(data, start, end)
+    )
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-", (0, 99)),
+    ("bytes=10-19", (10, 19)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=5-9, 20-29", (5, 9)),
+])
+def test_parse_satisfiable_ranges(header, expected):
+    assert parse_byte_range(header, 100) == expected
+
+@pytest.mark.parametrize("header", [None, "", "items=0-10", "bytes=", "bytes=abc-", "bytes=1-x", "bytes=-", "bytes=-0", "bytes=20-10", "bytes=150-10"])
+def test_malformed_ranges_fall_back_to_full_body(header):
+    assert parse_byte_range(header, 100) is None
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=100-100", "bytes=150-200"])
+def test_unsatisfiable_ranges_raise_416(header):
+    with pytest.raises(HTTPException) as error:
+        parse_byte_range(header, 100)
+    assert error.value.status_code == 416
+    assert error.value.headers["Content-Range"] == "bytes */100"
+
+@pytest.mark.parametrize("header", ["bytes=0-", "bytes=-5"])
+def test_any_range_on_empty_content_is_unsatisfiable(header):
+    with pytest.raises(HTTPException) as error:
+        parse_byte_range(header, 0)
+    assert error.value.headers["Content-Range"] == "bytes */0"
+
+def test_full_response_without_range():
+    response = range_response(DATA)
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "100"
+    assert response.headers["accept-ranges"] == "bytes"
+    assert "content-range" not in response.headers
+    assert read_body(response) == DATA
+
+def test_partial_response_for_range():
+    response = range_response(DATA, range="bytes=10-19")
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 10-19/100"
+    assert response.headers["content-length"] == "10"
+    assert read_body(response) == DATA[10:20]
+
+def test_invalid_range_spec_returns_full_body():
+    response = range_response(DATA, range="bytes=20-10")
+    assert response.status_code == 200
+    assert "content-range" not in response.headers
+    assert read_body(response) == DATA
+
+def test_suffix_range_returns_tail():
+    response = range_response(DATA, range="bytes=-7")
+    assert response.status_code == 206
+    assert read_body(response) == DATA[-7:]
+
+def test_zero_length_content_without_range():
+    response = range_response(b"")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "0"
+    assert read_body(response) == b""
+
+def test_matching_etag_returns_304():
+    response = range_response(DATA, if_none_match='"etag"', range="bytes=0-")
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"etag"'
@@ -0,0 +1,74 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from starlette.requests import Request
+
+import server
+from server import is_not_modified, make_etag
+
+ETAG = make_etag("activity", 1)
+LAST_MODIFIED = datetime(2024, 5, 1, 12, 30, 15, 500000, tzinfo=timezone.utc)
+LAST_MODIFIED_HTTP = "Wed, 01 May 2024 12:30:15 GMT"
+
+def make_request(**headers) -> Request:
+    raw_headers = [(name.replace("_", "-").encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw_headers})
+
+@pytest.mark.parametrize("if_none_match", [
+    ETAG,
+    f"W/{ETAG}",
+    f'"other", {ETAG}',
+    f'W/"other",W/{ETAG}',
+    "*",
+])
+def test_matching_if_none_match(if_none_match):
+    assert is_not_modified(make_request(if_none_match=if_none_match), ETAG, LAST_MODIFIED)
+
+@pytest.mark.parametrize("if_none_match", ['"other"', 'W/"other", "another"', ETAG.strip('"'), ""])
+def test_non_matching_if_none_match(if_none_match):
+    assert not is_not_modified(make_request(if_none_match=if_none_match), ETAG, LAST_MODIFIED)
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    request = make_request(if_none_match='"other"', if_modified_since=LAST_MODIFIED_HTTP)
+    assert not is_not_modified(request, ETAG, LAST_MODIFIED)
+
+@pytest.mark.parametrize("if_modified_since, expected", [
+    (LAST_MODIFIED_HTTP, True),
+    ("Thu, 02 May 2024 00:00:00 GMT", True),
+    ("Wed, 01 May 2024 12:30:14 GMT", False),
+])
+def test_if_modified_since(if_modified_since, expected):
+    assert is_not_modified(make_request(if_modified_since=if_modified_since), ETAG, LAST_MODIFIED) is expected
+
+@pytest.mark.parametrize("if_modified_since", ["not a date", "", "Wed, 32 May 2024 99:00:00 GMT"])
+def test_invalid_if_modified_since_is_ignored(if_modified_since):
+    assert not is_not_modified(make_request(if_modified_since=if_modified_since), ETAG, LAST_MODIFIED)
+
+def test_if_modified_since_without_last_modified():
+    assert not is_not_modified(make_request(if_modified_since=LAST_MODIFIED_HTTP), ETAG, None)
+
+def test_no_conditional_headers():
+    assert not is_not_modified(make_request(), ETAG, LAST_MODIFIED)
+
+def test_exposure_report_is_not_validated_by_date(monkeypatch):
+    # A rename changes the report without touching any timestamp, so If-Modified-Since must not 304
+    database = AsyncMongoMockClient()["revivedu_test"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setitem(server.app.dependency_overrides, server.get_current_user, lambda: {"id": "user-1"})
+    
+    async def seed():
+        await database.children.insert_one({"id": "child-1", "user_id": "user-1", "name": "Ada", "age": 6})
+        await database.child_exposure.insert_one({
+            "child_id": "child-1", **server.empty_child_exposure(), "initialized": True,
+            "tracking_since": "2024-05-01T00:00:00+00:00", "updated_at": "2024-05-01T00:00:00+00:00"
+        })
+    asyncio.run(seed())
+    
+    client = TestClient(server.app)
+    response = client.get("/api/children/child-1/exposure-report", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert response.status_code == 200
+    assert "last-modified" not in response.headers
+    assert client.get("/api/children/child-1/exposure-report", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
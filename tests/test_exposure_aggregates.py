@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+
+CHILD_ID = "child-1"
+START = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()["revivedu_test"]
+    monkeypatch.setattr(server, "db", database)
+    return database
+
+def stamp(minutes: int) -> str:
+    return (START + timedelta(minutes=minutes)).isoformat()
+
+def activity(activity_id: str, created_at: str, intelligence: str = "Spatial") -> dict:
+    return {
+        "id": activity_id,
+        "child_id": CHILD_ID,
+        "intelligences": [intelligence],
+        "subjects": ["Math"],
+        "skills": ["counting"],
+        "created_at": created_at
+    }
+
+async def insert_activities(db, *activities):
+    await db.activities.insert_many([dict(doc) for doc in activities])
+    await server.record_activity_exposure(list(activities))
+
+async def insert_feedback(db, rating: int, created_at: str):
+    doc = {"child_id": CHILD_ID, "activity_id": "a1", "rating": rating, "created_at": created_at}
+    await db.feedbacks.insert_one(dict(doc))
+    await server.record_feedback_exposure(doc)
+
+def test_first_activity_is_counted_once(db):
+    async def scenario():
+        await insert_activities(db, activity("a1", stamp(0)))
+        return await server.backfill_child_exposure(CHILD_ID)
+    exposure = asyncio.run(scenario())
+    assert exposure["initialized"]
+    assert exposure["total_activities"] == 1
+    assert server.decode_exposure_counts(exposure["intelligence_counts"]) == {"Spatial": 1}
+
+def test_first_rating_is_counted_once(db):
+    async def scenario():
+        await insert_feedback(db, 4, stamp(0))
+        return await server.backfill_child_exposure(CHILD_ID)
+    exposure = asyncio.run(scenario())
+    assert (exposure["rating_total"], exposure["rating_count"]) == (4, 1)
+
+def test_history_before_tracking_is_backfilled(db):
+    async def scenario():
+        await db.activities.insert_one(activity("old", stamp(-60), "Musical"))
+        await db.feedbacks.insert_one({"child_id": CHILD_ID, "rating": 2, "created_at": stamp(-30)})
+        # Batch items are stamped at generation time, before a later single insert lands
+        await insert_activities(db, activity("single", stamp(10)))
+        await insert_activities(db, activity("batch-1", stamp(1)), activity("batch-2", stamp(2)))
+        await insert_feedback(db, 5, stamp(20))
+        return await server.backfill_child_exposure(CHILD_ID)
+    exposure = asyncio.run(scenario())
+    assert exposure["tracking_since"] == stamp(1)
+    assert exposure["total_activities"] == 4
+    assert server.decode_exposure_counts(exposure["intelligence_counts"]) == {"Musical": 1, "Spatial": 3}
+    assert server.decode_exposure_counts(exposure["subject_counts"]) == {"Math": 4}
+    assert (exposure["rating_total"], exposure["rating_count"]) == (7, 2)
+
+def test_backfill_applies_once(db):
+    async def scenario():
+        await db.activities.insert_one(activity("old", stamp(-60)))
+        await insert_activities(db, activity("new", stamp(0)))
+        await server.backfill_child_exposure(CHILD_ID)
+        return await server.backfill_child_exposure(CHILD_ID)
+    assert asyncio.run(scenario())["total_activities"] == 2
+
+def test_new_child_starts_initialized(db):
+    async def scenario():
+        profile = server.ChildProfileInput(name="Ada", age=6)
+        child = await server.create_child_profile(profile, current_user={"id": "user-1"})
+        await server.record_activity_exposure([{**activity("a1", stamp(0)), "child_id": child.id}])
+        return await db.child_exposure.find_one({"child_id": child.id}, {"_id": 0})
+    exposure = asyncio.run(scenario())
+    assert exposure["initialized"]
+    assert exposure["total_activities"] == 1
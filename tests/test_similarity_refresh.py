@@ -0,0 +1,45 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+
+START = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()["revivedu_test"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "similarity_index", server.ActivitySimilarityIndex())
+    return database
+
+def activity(activity_id: str, seconds: int) -> dict:
+    return {
+        "id": activity_id,
+        "age": 7,
+        "subjects": ["Science"],
+        "intelligences": ["Naturalistic"],
+        "tools": ["Paper"],
+        "title": f"Activity {activity_id}",
+        "created_at": (START + timedelta(seconds=seconds)).isoformat()
+    }
+
+def test_refresh_picks_up_activities_inserted_late(db):
+    async def scenario():
+        await db.activities.insert_one(activity("newer", 60))
+        await server.refresh_similarity_index()
+        # Stamped before "newer" but inserted after it was indexed, as another worker's batch can be
+        await db.activities.insert_one(activity("late", 30))
+        await server.refresh_similarity_index()
+    asyncio.run(scenario())
+    assert set(server.similarity_index.ids) == {"newer", "late"}
+
+def test_refresh_does_not_index_rows_twice(db):
+    async def scenario():
+        await db.activities.insert_many([activity("a", 0), activity("b", 1)])
+        await server.refresh_similarity_index()
+        await server.refresh_similarity_index()
+    asyncio.run(scenario())
+    assert server.similarity_index.ids == ["a", "b"]
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from server import IncrementalActivityParser
+
+ACTIVITY = {
+    "title": "Shadows, Light [and] {Shapes}",
+    "objective": "Say \"hello\" to a shadow \\ then trace it",
+    "materials_required": ["Torch", "Paper, white", "Toys ]["],
+    "curricular_areas": {"ncf_se_2023": ["Science: Light"], "learning_domains": ["Cognitive"]},
+    "instructions": [{"step": 1, "text": "Darken the room, then {wait}"}, {"step": 2, "details": {"angles": [30, 60]}}],
+    "estimated_time": 45,
+    "extensions": []
+}
+
+def feed_in_chunks(text: str, chunk_size: int) -> list:
+    parser = IncrementalActivityParser()
+    events = []
+    for offset in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[offset:offset + chunk_size]))
+    return events
+
+def field_values(events: list) -> dict:
+    return {event["field"]: event["value"] for event in events if "index" not in event}
+
+def item_values(events: list, field: str) -> list:
+    return [event["value"] for event in events if event["field"] == field and "index" in event]
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 10_000])
+def test_chunk_size_does_not_change_events(chunk_size):
+    text = json.dumps(ACTIVITY, indent=2)
+    assert feed_in_chunks(text, chunk_size) == feed_in_chunks(text, len(text))
+    assert field_values(feed_in_chunks(text, chunk_size)) == ACTIVITY
+
+def test_fenced_input_is_parsed_and_trailing_text_ignored():
+    text = "```json\n" + json.dumps(ACTIVITY) + "\n```\nHope this helps!"
+    events = feed_in_chunks(text, 1)
+    assert field_values(events) == ACTIVITY
+
+def test_brackets_commas_and_escapes_inside_strings():
+    events = feed_in_chunks(json.dumps(ACTIVITY), 1)
+    values = field_values(events)
+    assert values["title"] == "Shadows, Light [and] {Shapes}"
+    assert values["objective"] == "Say \"hello\" to a shadow \\ then trace it"
+    assert item_values(events, "materials_required") == ["Torch", "Paper, white", "Toys ]["]
+
+def test_arrays_of_objects_stream_one_item_per_object():
+    events = feed_in_chunks(json.dumps(ACTIVITY), 1)
+    assert item_values(events, "instructions") == ACTIVITY["instructions"]
+    assert [event["index"] for event in events if event["field"] == "instructions" and "index" in event] == [0, 1]
+    assert item_values(events, "extensions") == []
+
+def test_fields_are_emitted_as_soon_as_they_close():
+    parser = IncrementalActivityParser()
+    assert parser.feed('{"title": "Sha') == []
+    assert parser.feed('dows", "estimated_time": 4') == [{"field": "title", "value": "Shadows"}]
+    assert parser.feed("5}") == [{"field": "estimated_time", "value": 45}]
+    assert parser.done